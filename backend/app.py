@@ -1,117 +1,603 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import numpy as np
 import cv2
 from PIL import Image
 import io
 import base64
-import tempfile
+import json
 import os
-from dct_compression import DCTImageCompression
+import time
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dct_compression import DCTImageCompression, InvalidParameterError, RD_CURVE_QUALITIES, scaled_progress
 from image_cartoonification import ImageCartoonification
 from histogram_equalization import HistogramEqualization
+from result_cache import ResultCache
+from image_store import ImageStore, StoredImage, ImageNotFoundError
+from job_queue import JobQueue, QueueFullError, JobNotFoundError, DEFAULT_JOB_WORKERS
+from job_queue import JOB_DONE, JOB_FAILED, JOB_CANCELLED, FINISHED_STATES
+
+# Response header carrying the JSON metadata of binary responses
+METADATA_HEADER = 'X-Result-Metadata'
+# Largest serialized array kept in that header: the integer 256-bin histograms fit, bigger
+# ones (per-block error maps) are only returned with responseFormat=json
+METADATA_FIELD_LIMIT = 4096
+# Compact separators for header JSON
+HEADER_JSON_SEPARATORS = (',', ':')
+# Response header reporting whether the result was served from the cache
+CACHE_HEADER = 'X-Result-Cache'
+
+# Parameters that determine each operation's result, as (type, default);
+# cache keys use the normalized values so equivalent requests share an entry
+CACHE_PARAMS = {
+    'compress': {
+        'quality': (int, 50), 'blockSize': (int, 8), 'colorMode': (str, 'rgb'),
+        'subsampling': (str, '4:2:0'), 'returnBitstream': (bool, False),
+        'targetPsnr': (float, None), 'targetBytes': (int, None),
+        'channelErrors': (bool, False), 'errorMap': (bool, False)
+    },
+    'rd_curve': {
+        'qualities': (list, RD_CURVE_QUALITIES), 'blockSizes': (list, ()), 'blockSize': (int, 8),
+        'colorMode': (str, 'rgb'), 'subsampling': (str, '4:2:0')
+    },
+    'cartoonify': {
+        'style': (str, 'anime'), 'intensity': (int, 5), 'colorLevels': (int, 8), 'quantization': (str, 'kmeans'),
+        'preview': (bool, False), 'maxPreviewSize': (int, 512), 'previewUpscale': (bool, False)
+    },
+    'histogram_equalize': {
+        'type': (str, 'global'), 'clipLimit': (float, 2.0), 'tileGridSize': (int, 8),
+        'histogramFormat': (str, 'image'), 'retinexMode': (str, 'fast')
+    },
+    'advanced_enhance': {
+        'type': (str, 'clahe'), 'clipLimit': (float, 2.0), 'tileGridSize': (int, 8),
+        'useAdvanced': (bool, True), 'histogramFormat': (str, 'image'), 'retinexMode': (str, 'fast')
+    }
+}
+
+# Seconds between keep-alive comments on an idle job event stream
+JOB_EVENTS_KEEPALIVE = 15
+# Retry-After hint, in seconds, when the job queue is full
+JOB_RETRY_AFTER = 5
+
+# Batch items decoded and processed at once; bounds the memory held by a streamed batch
+BATCH_MAX_IN_FLIGHT = 8
+# Archive members treated as images by /batch
+BATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff', '.gif')
+
+# Operations whose metrics depend on the size of the uploaded file, not just its pixels
+SIZE_DEPENDENT_OPERATIONS = ('compress', 'rd_curve')
 
 # Initialize Flask app
 app = Flask(__name__)
-CORS(app)  # Enable CORS for React app
+CORS(app, expose_headers=[METADATA_HEADER, CACHE_HEADER])  # Enable CORS for React app
 
 # Initialize modules
-compressor = DCTImageCompression()
+compressor = DCTImageCompression(workers=int(os.environ.get('DCT_WORKERS', os.cpu_count() or 1)))
 cartoonifier = ImageCartoonification()
 hist_equalizer = HistogramEqualization()
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get('RESULT_CACHE_MB', 256)) * 1024 * 1024,
+    disk_dir=os.environ.get('RESULT_CACHE_DIR') or None,
+    disk_max_bytes=int(os.environ.get('RESULT_CACHE_DISK_MB', 2048)) * 1024 * 1024
+)
+image_store = ImageStore(
+    ttl=int(os.environ.get('IMAGE_STORE_TTL', 600)),
+    max_bytes=int(os.environ.get('IMAGE_STORE_MB', 512)) * 1024 * 1024
+)
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1)), thread_name_prefix='batch'
+)
+# Job state lives in this process, so jobs can be turned off (JOB_WORKERS=0) where
+# requests are spread over several worker processes
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', DEFAULT_JOB_WORKERS))
+job_queue = JobQueue(
+    workers=JOB_WORKERS,
+    max_pending=int(os.environ.get('JOB_QUEUE_SIZE', 16)),
+    retention=int(os.environ.get('JOB_RETENTION', 600)),
+    max_finished=int(os.environ.get('JOB_MAX_FINISHED', 0)) or None
+) if JOB_WORKERS > 0 else None
 
-def decode_base64_image(image_data):
-    """Helper function to decode base64 image"""
-    image_bytes = base64.b64decode(image_data.split(',')[1])
+def decode_image_bytes(image_bytes):
+    """Helper function to decode encoded image bytes to an RGB array"""
     image = Image.open(io.BytesIO(image_bytes))
     if image.mode != 'RGB':
         image = image.convert('RGB')
-    return np.array(image), image_bytes
+    return np.array(image)
 
-def encode_image_to_base64(image_array, quality=95):
-    """Helper function to encode image array to base64"""
+def decode_base64_image(image_data):
+    """Helper function to decode base64 image"""
+    image_bytes = base64.b64decode(image_data.split(',')[1])
+    return decode_image_bytes(image_bytes), image_bytes
+
+def encode_image_to_bytes(image_array, quality=95):
+    """Helper function to encode image array to JPEG bytes"""
     image_pil = Image.fromarray(image_array.astype(np.uint8))
     buffer = io.BytesIO()
     image_pil.save(buffer, format='JPEG', quality=quality)
-    return base64.b64encode(buffer.getvalue()).decode()
+    return buffer.getvalue()
+
+def encode_image_to_base64(image_array, quality=95):
+    """Helper function to encode image array to base64"""
+    return base64.b64encode(encode_image_to_bytes(image_array, quality)).decode()
+
+def param_bool(params, key, default=False):
+    """Read a boolean parameter from JSON (true/false) or form/query ('true', '1') values"""
+    value = params.get(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def param_list(params, key, default):
+    """Read a list parameter from a JSON array or a comma-separated form/query value"""
+    value = params.get(key)
+    if value is None:
+        return list(default)
+    if isinstance(value, str):
+        return [item for item in value.split(',') if item.strip()]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def read_image_request():
+    """Read the image source and parameters from a JSON, multipart, raw image or image handle request"""
+    if 'image' in request.files:
+        # Multipart upload: parameters come from the form fields and query string
+        image_bytes = request.files['image'].read()
+        params = request.values.to_dict()
+        binary = True
+    elif request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        # Raw image body: parameters come from the query string
+        image_bytes = request.get_data()
+        params = request.args.to_dict()
+        binary = True
+    elif request.is_json:
+        params = request.get_json()
+        image_bytes = base64.b64decode(params['image'].split(',')[1]) if 'image' in params else None
+        binary = False
+    else:
+        # Form or query parameters referring to a previously uploaded image
+        image_bytes = None
+        params = request.values.to_dict()
+        binary = True
+    
+    # Binary uploads get binary responses unless JSON is explicitly requested
+    if binary and params.get('responseFormat') == 'json':
+        binary = False
+    
+    if image_bytes:
+        source = StoredImage(decode_image_bytes(image_bytes), image_bytes)
+    elif params.get('imageId'):
+        # Reuse the decoded pixels and derived planes kept from /upload
+        source = image_store.get(params['imageId'])
+    else:
+        raise ValueError("No image or imageId provided")
+    
+    return source, params, binary
+
+def header_metadata(value, omitted, path=''):
+    """Header-sized metadata: drop inline data URLs (histogram plots, bitstreams) and arrays
+    larger than METADATA_FIELD_LIMIT, recording the dotted paths of the arrays in omitted"""
+    if isinstance(value, dict):
+        kept = {}
+        for k, v in value.items():
+            if isinstance(v, str) and v.startswith('data:'):
+                continue
+            key_path = f"{path}.{k}" if path else k
+            if isinstance(v, list) and len(json.dumps(v, separators=HEADER_JSON_SEPARATORS)) > METADATA_FIELD_LIMIT:
+                omitted.append(key_path)
+                continue
+            kept[k] = header_metadata(v, omitted, key_path)
+        return kept
+    return value
+
+def image_response(binary, image_array, image_key, fields, bitstream=None):
+    """Build a JSON response, or a binary image response with metadata in a header"""
+    if binary:
+        omitted = []
+        metadata = header_metadata(dict(fields, success=True), omitted)
+        if omitted:
+            metadata['omittedFields'] = omitted
+        if bitstream is not None:
+            body, mimetype = bitstream, 'application/octet-stream'
+        else:
+            body, mimetype = encode_image_to_bytes(image_array), 'image/jpeg'
+        return Response(body, mimetype=mimetype, headers={METADATA_HEADER: json.dumps(metadata, separators=HEADER_JSON_SEPARATORS)})
+    
+    payload = {'success': True, image_key: f"data:image/jpeg;base64,{encode_image_to_base64(image_array)}"}
+    payload.update(fields)
+    if bitstream is not None:
+        payload['bitstream'] = f"data:application/x-dct-bitstream;base64,{base64.b64encode(bitstream).decode()}"
+    return jsonify(payload)
+
+def normalize_params(operation, params):
+    """Normalize the result-determining parameters of an operation for cache keys"""
+    normalized = {}
+    for key, (kind, default) in CACHE_PARAMS[operation].items():
+        if kind is bool:
+            normalized[key] = param_bool(params, key, default)
+        elif kind is list:
+            normalized[key] = [int(value) for value in param_list(params, key, default)]
+        else:
+            value = params.get(key, default)
+            normalized[key] = kind(value) if value is not None else None
+    return normalized
+
+def result_cache_key(operation, source, params, binary):
+    """Content-addressed cache key: decoded pixels plus normalized parameters"""
+    normalized = normalize_params(operation, params)
+    normalized['binary'] = binary
+    if operation in SIZE_DEPENDENT_OPERATIONS:
+        normalized['originalSize'] = len(source.image_bytes)
+    return result_cache.make_key(operation, source_digest(source), normalized)
+
+def source_digest(source):
+    """Pixel digest of a request image, computed once per StoredImage"""
+    if source.digest is None:
+        # Stored images keep their digest, so handle requests hash the pixels once
+        source.digest = result_cache.image_digest(source.image)
+    return source.digest
+
+def response_entry(response):
+    """Encoded (body, mimetype, headers) of a response, as kept by the cache and job results"""
+    headers = {}
+    if METADATA_HEADER in response.headers:
+        headers[METADATA_HEADER] = response.headers[METADATA_HEADER]
+    return response.get_data(), response.mimetype, headers
+
+def entry_response(entry, cache_state=None):
+    """Rebuild a response from an encoded (body, mimetype, headers) entry"""
+    body, mimetype, headers = entry
+    if cache_state is not None:
+        headers = dict(headers, **{CACHE_HEADER: cache_state})
+    return Response(body, mimetype=mimetype, headers=headers)
+
+def cached_response(cache_key):
+    """Rebuild a stored response for the key, or return None on a miss"""
+    entry = result_cache.get(cache_key)
+    if entry is None:
+        return None
+    return entry_response(entry, 'hit')
+
+def store_response(cache_key, response):
+    """Store an encoded response in the result cache and return it"""
+    result_cache.put(cache_key, *response_entry(response))
+    response.headers[CACHE_HEADER] = 'miss'
+    return response
+
+def process_compress(source, params, progress=None):
+    """Run DCT compression; returns (compressed image, response fields, bitstream or None)"""
+    quality = int(params.get('quality', 50))
+    block_size = int(params.get('blockSize', 8))
+    color_mode = params.get('colorMode', 'rgb')
+    subsampling = params.get('subsampling', '4:2:0')
+    return_bitstream = param_bool(params, 'returnBitstream')
+    target_psnr = params.get('targetPsnr')
+    target_bytes = params.get('targetBytes')
+    channel_errors = param_bool(params, 'channelErrors')
+    error_map = param_bool(params, 'errorMap')
+    
+    print(f"Compression request: quality={quality}, blockSize={block_size}, colorMode={color_mode}")
+    
+    image_array = source.image
+    if target_psnr is not None or target_bytes is not None:
+        # Search the quality server-side instead of one round trip per guess
+        original, compressed, bitstream, quality = compressor.compress_to_target(
+            image_array,
+            target_psnr=float(target_psnr) if target_psnr is not None else None,
+            target_bytes=int(target_bytes) if target_bytes is not None else None,
+            block_size=block_size, color_mode=color_mode, subsampling=subsampling, progress=progress
+        )
+    else:
+        original, compressed, bitstream = compressor.encode_array(
+            image_array, quality, block_size, color_mode=color_mode, subsampling=subsampling, progress=progress
+        )
+    errors = compressor.calculate_error_metrics(
+        original, compressed, per_channel=channel_errors, block_size=block_size if error_map else None
+    )
+    psnr = errors['psnr']
+    mse = errors['mse']
+    
+    # Sizes come from the bitstream; the image is only a preview of the reconstruction
+    original_size = len(source.image_bytes)
+    compressed_size = len(bitstream)
+    compression_ratio = original_size / compressed_size if compressed_size > 0 else 1
+    space_saved = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
+    
+    fields = {
+        'quality': quality,
+        'metrics': {
+            'psnr': round(psnr, 2),
+            'mse': round(mse, 2),
+            'compressionRatio': round(compression_ratio, 2),
+            'spaceSaved': round(space_saved, 1),
+            'originalSize': original_size,
+            'compressedSize': compressed_size
+        }
+    }
+    if target_psnr is not None:
+        # The search stops at the quality bounds, so report whether the target was reachable
+        fields['targetMet'] = bool(psnr >= float(target_psnr))
+        fields['targetAchieved'] = round(psnr, 2)
+    elif target_bytes is not None:
+        fields['targetMet'] = compressed_size <= int(target_bytes)
+        fields['targetAchieved'] = compressed_size
+    if channel_errors:
+        fields['metrics']['channelMse'] = [round(value, 2) for value in errors['channel_mse']]
+    if error_map:
+        fields['metrics']['blockMse'] = np.round(errors['block_mse'], 2).tolist()
+    
+    return compressed, fields, bitstream if return_bitstream else None
+
+def process_cartoonify(source, params, progress=None):
+    """Run cartoonification; returns (cartoon image, response fields)"""
+    style = params.get('style', 'anime')
+    intensity = int(params.get('intensity', 5))
+    color_levels = int(params.get('colorLevels', 8))
+    quantization = params.get('quantization', 'kmeans')
+    preview = param_bool(params, 'preview', False)
+    max_preview_size = int(params.get('maxPreviewSize', 512))
+    preview_upscale = param_bool(params, 'previewUpscale', False)
+    
+    print(f"Cartoonify request: {style}, intensity={intensity}, colors={color_levels}, preview={preview}")
+    
+    # Apply cartoon effect
+    cartoon_array = cartoonifier.apply_cartoon_effect(
+        source.image, style, intensity, color_levels, progress, quantization, image_key=source_digest(source),
+        preview=preview, max_preview_size=max_preview_size, preview_upscale=preview_upscale
+    )
+    
+    return cartoon_array, {
+        'style': style,
+        'intensity': intensity,
+        'colorLevels': color_levels,
+        'quantization': quantization,
+        'preview': preview,
+        'width': cartoon_array.shape[1],
+        'height': cartoon_array.shape[0]
+    }
+
+def process_histogram_equalize(source, params, progress=None):
+    """Run histogram equalization; returns (enhanced image, response fields)"""
+    enhancement_type = params.get('type', 'global')
+    clip_limit = float(params.get('clipLimit', 2.0))
+    tile_grid_size = int(params.get('tileGridSize', 8))
+    histogram_format = params.get('histogramFormat', 'image')
+    retinex_mode = params.get('retinexMode', 'fast')
+    
+    print(f"Histogram equalization request: {enhancement_type}, clip={clip_limit}, tile={tile_grid_size}")
+    
+    # Apply enhancement based on type
+    if enhancement_type == 'clahe':
+        enhanced_array, histogram_data, enhanced_planes = hist_equalizer.apply_enhancement(
+            source.image, enhancement_type, clip_limit=clip_limit, tile_grid_size=tile_grid_size,
+            planes=source.planes, progress=progress, histogram_format=histogram_format, return_planes=True
+        )
+    elif enhancement_type in ['adaptive']:
+        enhanced_array, histogram_data, enhanced_planes = hist_equalizer.apply_enhancement(
+            source.image, enhancement_type, tile_grid_size=tile_grid_size, planes=source.planes,
+            progress=progress, histogram_format=histogram_format, return_planes=True
+        )
+    else:
+        enhanced_array, histogram_data, enhanced_planes = hist_equalizer.apply_enhancement(
+            source.image, enhancement_type, planes=source.planes, progress=progress,
+            histogram_format=histogram_format, return_planes=True, retinex_mode=retinex_mode
+        )
+    
+    # Calculate enhancement metrics
+    metrics = hist_equalizer.calculate_enhancement_metrics(source.image, enhanced_array, planes=source.planes,
+                                                           enhanced_planes=enhanced_planes)
+    
+    return enhanced_array, {
+        'type': enhancement_type,
+        'clipLimit': clip_limit,
+        'tileGridSize': tile_grid_size,
+        'histograms': histogram_data,
+        'metrics': metrics
+    }
+
+def process_advanced_enhance(source, params, progress=None):
+    """Run the advanced enhancement pipeline; returns (enhanced image, response fields)"""
+    enhancement_type = params.get('type', 'clahe')
+    clip_limit = float(params.get('clipLimit', 2.0))
+    tile_grid_size = int(params.get('tileGridSize', 8))
+    use_advanced = param_bool(params, 'useAdvanced', True)
+    histogram_format = params.get('histogramFormat', 'image')
+    retinex_mode = params.get('retinexMode', 'fast')
+    
+    print(f"Advanced enhancement request: {enhancement_type}, advanced={use_advanced}")
+    
+    if use_advanced:
+        # Use advanced pipeline
+        enhanced_array, histogram_data, enhanced_planes = hist_equalizer.advanced_enhancement_pipeline(
+            source.image,
+            enhancement_type=enhancement_type,
+            clip_limit=clip_limit,
+            tile_grid_size=tile_grid_size,
+            planes=source.planes,
+            progress=progress,
+            histogram_format=histogram_format,
+            return_planes=True,
+            retinex_mode=retinex_mode
+        )
+    else:
+        # Use basic enhancement
+        enhanced_array, histogram_data, enhanced_planes = hist_equalizer.apply_enhancement(
+            source.image, enhancement_type, clip_limit, tile_grid_size, planes=source.planes,
+            progress=progress, histogram_format=histogram_format, return_planes=True, retinex_mode=retinex_mode
+        )
+    
+    # Calculate comprehensive metrics
+    metrics = hist_equalizer.calculate_enhancement_metrics(source.image, enhanced_array, planes=source.planes,
+                                                           enhanced_planes=enhanced_planes)
+    
+    return enhanced_array, {
+        'type': enhancement_type,
+        'clipLimit': clip_limit,
+        'tileGridSize': tile_grid_size,
+        'histograms': histogram_data,
+        'metrics': metrics,
+        'advanced': use_advanced
+    }
+
+def process_rd_curve(source, params, progress=None):
+    """Sweep qualities (and block sizes); returns the response fields"""
+    qualities = [int(q) for q in param_list(params, 'qualities', RD_CURVE_QUALITIES)]
+    block_sizes = [int(b) for b in param_list(params, 'blockSizes', [params.get('blockSize', 8)])]
+    color_mode = params.get('colorMode', 'rgb')
+    subsampling = params.get('subsampling', '4:2:0')
+    
+    print(f"RD curve request: {len(qualities)} qualities, blockSizes={block_sizes}, colorMode={color_mode}")
+    
+    original_size = len(source.image_bytes)
+    
+    # One forward transform per block size; each point only re-quantizes
+    curves = []
+    for i, block_size in enumerate(block_sizes):
+        points = compressor.rate_distortion_curve(
+            source.image, qualities, block_size, color_mode=color_mode, subsampling=subsampling,
+            progress=scaled_progress(progress, i / len(block_sizes), 1 / len(block_sizes))
+        )
+        curves.append({
+            'blockSize': block_size,
+            'points': [{
+                'quality': point['quality'],
+                'psnr': round(point['psnr'], 2),
+                'mse': round(point['mse'], 2),
+                'compressedSize': point['size'],
+                'compressionRatio': round(original_size / point['size'], 2) if point['size'] > 0 else 1
+            } for point in points]
+        })
+    
+    return {
+        'originalSize': original_size,
+        'colorMode': color_mode,
+        'curves': curves
+    }
+
+def check_params(operation, params):
+    """Reject out-of-range DCT parameters before any work is done (InvalidParameterError)"""
+    if operation == 'compress':
+        if params.get('targetPsnr') is None and params.get('targetBytes') is None:
+            compressor.check_parameters(quality=int(params.get('quality', 50)))
+        compressor.check_parameters(block_size=int(params.get('blockSize', 8)))
+    elif operation == 'rd_curve':
+        for quality in param_list(params, 'qualities', RD_CURVE_QUALITIES):
+            compressor.check_parameters(quality=int(quality))
+        for block_size in param_list(params, 'blockSizes', [params.get('blockSize', 8)]):
+            compressor.check_parameters(block_size=int(block_size))
+
+def run_operation(operation, source, params, binary, progress=None):
+    """Run a processing operation and build its response"""
+    if operation == 'compress':
+        compressed, fields, bitstream = process_compress(source, params, progress)
+        return image_response(binary, compressed, 'compressedImage', fields, bitstream)
+    if operation == 'rd_curve':
+        return jsonify(dict(success=True, **process_rd_curve(source, params, progress)))
+    if operation == 'cartoonify':
+        cartoon_array, fields = process_cartoonify(source, params, progress)
+        return image_response(binary, cartoon_array, 'cartoonImage', fields)
+    if operation == 'histogram_equalize':
+        enhanced_array, fields = process_histogram_equalize(source, params, progress)
+        return image_response(binary, enhanced_array, 'enhancedImage', fields)
+    if operation == 'advanced_enhance':
+        enhanced_array, fields = process_advanced_enhance(source, params, progress)
+        return image_response(binary, enhanced_array, 'enhancedImage', fields)
+    raise ValueError(f"Unknown operation: {operation}")
+
+@app.route('/upload', methods=['POST'])
+def upload_image():
+    """Decode an image once and return a handle for the processing endpoints"""
+    try:
+        source, _, _ = read_image_request()
+        image_id = image_store.put(source)
+        height, width = source.image.shape[:2]
+        
+        print(f"Upload request: {width}x{height}, imageId={image_id}")
+        
+        return jsonify({
+            'success': True,
+            'imageId': image_id,
+            'width': width,
+            'height': height,
+            'originalSize': len(source.image_bytes),
+            'expiresIn': image_store.ttl
+        })
+    
+    except Exception as e:
+        print(f"Upload error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/upload/<image_id>', methods=['DELETE'])
+def delete_upload(image_id):
+    """Release an image handle"""
+    return jsonify({'success': image_store.discard(image_id)})
 
 @app.route('/compress', methods=['POST'])
 def compress_image():
     """DCT Compression endpoint"""
     try:
-        data = request.get_json()
-        image_data = data['image']
-        quality = int(data.get('quality', 50))
-        block_size = int(data.get('blockSize', 8))
-        
-        print(f"Compression request: quality={quality}, blockSize={block_size}")
-        
-        image_array, image_bytes = decode_base64_image(image_data)
+        source, params, binary = read_image_request()
+        check_params('compress', params)
+        cache_key = result_cache_key('compress', source, params, binary)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
         
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            Image.fromarray(image_array).save(temp_file.name, 'JPEG')
-            temp_path = temp_file.name
-        
-        try:
-            original, compressed = compressor.compress_image(temp_path, quality, block_size)
-            psnr = compressor.calculate_psnr(original, compressed)
-            mse = compressor.calculate_mse(original, compressed)
-            
-            compressed_base64 = encode_image_to_base64(compressed, quality)
-            
-            original_size = len(image_bytes)
-            compressed_size = len(base64.b64decode(compressed_base64))
-            compression_ratio = original_size / compressed_size if compressed_size > 0 else 1
-            space_saved = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
-            
-            return jsonify({
-                'success': True,
-                'compressedImage': f"data:image/jpeg;base64,{compressed_base64}",
-                'metrics': {
-                    'psnr': round(psnr, 2),
-                    'mse': round(mse, 2),
-                    'compressionRatio': round(compression_ratio, 2),
-                    'spaceSaved': round(space_saved, 1),
-                    'originalSize': original_size,
-                    'compressedSize': compressed_size
-                }
-            })
-            
-        finally:
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-                
+        return store_response(cache_key, run_operation('compress', source, params, binary))
+    
+    except ImageNotFoundError as e:
+        # Handle expired or evicted: the client re-uploads and retries
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    except InvalidParameterError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     except Exception as e:
         print(f"Compression error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/compress/rd_curve', methods=['POST'])
+def compress_rd_curve():
+    """Rate-distortion curve endpoint: PSNR/MSE/size across a quality sweep"""
+    try:
+        source, params, _ = read_image_request()
+        check_params('rd_curve', params)
+        cache_key = result_cache_key('rd_curve', source, params, False)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        return store_response(cache_key, run_operation('rd_curve', source, params, False))
+    
+    except ImageNotFoundError as e:
+        # Handle expired or evicted: the client re-uploads and retries
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    except InvalidParameterError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    except Exception as e:
+        print(f"RD curve error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/cartoonify', methods=['POST'])
 def cartoonify_image():
     """Cartoonification endpoint"""
     try:
-        data = request.get_json()
-        image_data = data['image']
-        style = data.get('style', 'anime')
-        intensity = int(data.get('intensity', 5))
-        color_levels = int(data.get('colorLevels', 8))
-        
-        print(f"Cartoonify request: {style}, intensity={intensity}, colors={color_levels}")
-        
-        image_array, _ = decode_base64_image(image_data)
-        
-        # Apply cartoon effect
-        cartoon_array = cartoonifier.apply_cartoon_effect(image_array, style, intensity, color_levels)
-        
-        cartoon_base64 = encode_image_to_base64(cartoon_array)
-        
-        return jsonify({
-            'success': True,
-            'cartoonImage': f"data:image/jpeg;base64,{cartoon_base64}",
-            'style': style,
-            'intensity': intensity,
-            'colorLevels': color_levels
-        })
+        source, params, binary = read_image_request()
+        cache_key = result_cache_key('cartoonify', source, params, binary)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
         
+        return store_response(cache_key, run_operation('cartoonify', source, params, binary))
+    
+    except ImageNotFoundError as e:
+        # Handle expired or evicted: the client re-uploads and retries
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
     except Exception as e:
         print(f"Cartoonification error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -120,45 +606,18 @@ def cartoonify_image():
 def histogram_equalize():
     """Histogram equalization endpoint"""
     try:
-        data = request.get_json()
-        image_data = data['image']
-        enhancement_type = data.get('type', 'global')
-        clip_limit = float(data.get('clipLimit', 2.0))
-        tile_grid_size = int(data.get('tileGridSize', 8))
-        
-        print(f"Histogram equalization request: {enhancement_type}, clip={clip_limit}, tile={tile_grid_size}")
-        
-        image_array, _ = decode_base64_image(image_data)
-        
-        # Apply enhancement based on type
-        if enhancement_type == 'clahe':
-            enhanced_array, histogram_data = hist_equalizer.apply_enhancement(
-                image_array, enhancement_type, clip_limit=clip_limit, tile_grid_size=tile_grid_size
-            )
-        elif enhancement_type in ['adaptive']:
-            enhanced_array, histogram_data = hist_equalizer.apply_enhancement(
-                image_array, enhancement_type, tile_grid_size=tile_grid_size
-            )
-        else:
-            enhanced_array, histogram_data = hist_equalizer.apply_enhancement(
-                image_array, enhancement_type
-            )
-        
-        # Calculate enhancement metrics
-        metrics = hist_equalizer.calculate_enhancement_metrics(image_array, enhanced_array)
-        
-        enhanced_base64 = encode_image_to_base64(enhanced_array)
-        
-        return jsonify({
-            'success': True,
-            'enhancedImage': f"data:image/jpeg;base64,{enhanced_base64}",
-            'type': enhancement_type,
-            'clipLimit': clip_limit,
-            'tileGridSize': tile_grid_size,
-            'histograms': histogram_data,
-            'metrics': metrics
-        })
+        source, params, binary = read_image_request()
+        cache_key = result_cache_key('histogram_equalize', source, params, binary)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
         
+        return store_response(cache_key, run_operation('histogram_equalize', source, params, binary))
+    
+    except ImageNotFoundError as e:
+        # Handle expired or evicted: the client re-uploads and retries
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
     except Exception as e:
         print(f"Histogram equalization error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -167,55 +626,300 @@ def histogram_equalize():
 def advanced_enhance():
     """Advanced enhancement with multiple techniques"""
     try:
-        data = request.get_json()
-        image_data = data['image']
-        enhancement_type = data.get('type', 'clahe')
-        clip_limit = float(data.get('clipLimit', 2.0))
-        tile_grid_size = int(data.get('tileGridSize', 8))
-        use_advanced = data.get('useAdvanced', True)
-        
-        print(f"Advanced enhancement request: {enhancement_type}, advanced={use_advanced}")
-        
-        image_array, _ = decode_base64_image(image_data)
-        
-        if use_advanced:
-            # Use advanced pipeline
-            enhanced_array, histogram_data = hist_equalizer.advanced_enhancement_pipeline(
-                image_array, 
-                enhancement_type=enhancement_type,
-                clip_limit=clip_limit,
-                tile_grid_size=tile_grid_size
-            )
+        source, params, binary = read_image_request()
+        cache_key = result_cache_key('advanced_enhance', source, params, binary)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        return store_response(cache_key, run_operation('advanced_enhance', source, params, binary))
+    
+    except ImageNotFoundError as e:
+        # Handle expired or evicted: the client re-uploads and retries
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    except Exception as e:
+        print(f"Advanced enhancement error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def archive_items(fileobj, kind, archive_name='archive'):
+    """Yield (name, bytes) for the image members of a 'zip' or 'tar' archive; a corrupt
+    archive ends with an (archive_name, error) item, reported like a bad image"""
+    try:
+        if kind == 'zip':
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                        yield info.filename, archive.read(info)
         else:
-            # Use basic enhancement
-            enhanced_array, histogram_data = hist_equalizer.apply_enhancement(
-                image_array, enhancement_type, clip_limit, tile_grid_size
-            )
+            # Stream mode reads members in order without seeking, so uploads need not be buffered
+            with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                        yield member.name, archive.extractfile(member).read()
+    except Exception as e:
+        yield archive_name, ValueError(f"Unreadable {kind} archive: {str(e)}")
+
+def archive_kind(name, mimetype):
+    """'zip' or 'tar' when an upload is an archive rather than a single image, else None"""
+    name = name.lower()
+    if name.endswith('.zip') or mimetype == 'application/zip':
+        return 'zip'
+    if name.endswith(('.tar', '.tar.gz', '.tgz')) or \
+            mimetype in ('application/x-tar', 'application/gzip', 'application/x-gzip'):
+        return 'tar'
+    return None
+
+def read_batch_request():
+    """Read the parameters and a lazy (name, data) iterator from a batch request, where data is
+    image bytes, a base64 data URL, or the error that made an archive unreadable"""
+    if request.files:
+        # Multipart: any number of image files and/or archives
+        params = request.values.to_dict()
         
-        # Calculate comprehensive metrics
-        metrics = hist_equalizer.calculate_enhancement_metrics(image_array, enhanced_array)
+        def items():
+            for storage in request.files.getlist('image') + request.files.getlist('archive'):
+                filename = storage.filename or 'image'
+                kind = archive_kind(filename, storage.mimetype)
+                if kind:
+                    yield from archive_items(storage.stream, kind, filename)
+                else:
+                    yield filename, storage.read()
+    elif archive_kind('', request.mimetype):
+        # Raw archive body: parameters come from the query string
+        params = request.args.to_dict()
         
-        enhanced_base64 = encode_image_to_base64(enhanced_array)
+        def items():
+            if archive_kind('', request.mimetype) == 'zip':
+                # Zip directories sit at the end of the file, so the body is buffered
+                yield from archive_items(io.BytesIO(request.get_data()), 'zip')
+            else:
+                yield from archive_items(request.stream, 'tar')
+    else:
+        params = request.get_json()
         
-        return jsonify({
-            'success': True,
-            'enhancedImage': f"data:image/jpeg;base64,{enhanced_base64}",
-            'type': enhancement_type,
-            'clipLimit': clip_limit,
-            'tileGridSize': tile_grid_size,
-            'histograms': histogram_data,
-            'metrics': metrics,
-            'advanced': use_advanced
-        })
+        def items():
+            for i, image in enumerate(params.get('images', [])):
+                yield f"image-{i}", image
+    
+    return params, items()
+
+def process_batch_item(operation, index, name, data, params):
+    """Process one batch item (see read_batch_request); returns (NDJSON line, success)"""
+    prefix = json.dumps({'index': index, 'name': name})[:-1].encode()
+    try:
+        if isinstance(data, Exception):
+            raise data
+        image_bytes = base64.b64decode(data.split(',')[-1]) if isinstance(data, str) else data
+        source = StoredImage(decode_image_bytes(image_bytes), image_bytes)
+        cache_key = result_cache_key(operation, source, params, False)
+        entry = result_cache.get(cache_key)
+        if entry is None:
+            with app.app_context():
+                entry = response_entry(run_operation(operation, source, params, False))
+            result_cache.put(cache_key, *entry)
         
+        # Splice the encoded response in as-is instead of re-parsing it
+        # (debug mode pretty-prints JSON, which has to be compacted onto one line)
+        body = entry[0].strip()
+        if b'\n' in body:
+            body = json.dumps(json.loads(body)).encode()
+        return prefix + b', "result": ' + body + b'}\n', True
+    
     except Exception as e:
-        print(f"Advanced enhancement error: {str(e)}")
+        print(f"Batch item error ({name}): {str(e)}")
+        return prefix + b', "result": ' + json.dumps({'success': False, 'error': str(e)}).encode() + b'}\n', False
+
+@app.route('/batch/<operation>', methods=['POST'])
+def batch_process(operation):
+    """Process many images with one parameter set, streaming NDJSON results as they finish"""
+    try:
+        if operation not in CACHE_PARAMS:
+            return jsonify({'success': False, 'error': f"Unknown operation: {operation}"}), 404
+        params, items = read_batch_request()
+        normalize_params(operation, params)  # reject bad parameters before streaming starts
+    
+    except Exception as e:
+        print(f"Batch request error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+    
+    print(f"Batch request: {operation}")
+    
+    def stream():
+        start = time.perf_counter()
+        count = 0
+        failed = 0
+        pending = set()
+        
+        def drain(futures):
+            nonlocal failed
+            for future in futures:
+                line, success = future.result()
+                failed += not success
+                yield line
+        
+        # Quantization tables, DCT bases and CLAHE objects are cached per process
+        # or worker thread, so every item after the first reuses them
+        try:
+            for index, (name, data) in enumerate(items):
+                pending.add(batch_executor.submit(process_batch_item, operation, index, name, data, params))
+                count += 1
+                if len(pending) >= BATCH_MAX_IN_FLIGHT:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from drain(done)
+        except Exception as e:
+            # The headers are already sent, so a broken request body is reported in-stream
+            print(f"Batch read error: {str(e)}")
+            failed += 1
+            yield json.dumps({'index': count, 'name': None,
+                              'result': {'success': False, 'error': str(e)}}).encode() + b'\n'
+            count += 1
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from drain(done)
+        
+        yield json.dumps({
+            'done': True,
+            'count': count,
+            'failed': failed,
+            'elapsed': round(time.perf_counter() - start, 3)
+        }).encode() + b'\n'
+    
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+def jobs_disabled():
+    """503 response for the job endpoints when async jobs are turned off"""
+    return jsonify({'success': False, 'error': 'Async jobs are disabled on this server (JOB_WORKERS=0)'}), 503
+
+@app.route('/jobs/<operation>', methods=['POST'])
+def submit_job(operation):
+    """Queue a long-running operation; returns a job id to poll or stream"""
+    if job_queue is None:
+        return jobs_disabled()
+    try:
+        if operation not in CACHE_PARAMS:
+            return jsonify({'success': False, 'error': f"Unknown operation: {operation}"}), 404
+        
+        source, params, binary = read_image_request()
+        check_params(operation, params)
+        binary = binary and operation != 'rd_curve'
+        cache_key = result_cache_key(operation, source, params, binary)
+        
+        def task(job):
+            # Jobs run outside the request, so they need their own app context for jsonify
+            with app.app_context():
+                entry = result_cache.get(cache_key)
+                if entry is None:
+                    response = run_operation(operation, source, params, binary, job.report)
+                    entry = response_entry(response)
+                    result_cache.put(cache_key, *entry)
+                return entry
+        
+        job = job_queue.submit(operation, task)
+        
+        print(f"Job submitted: {operation}, jobId={job.id}")
+        
+        response = jsonify(dict(job.to_dict(), success=True,
+                                statusUrl=f"/jobs/{job.id}", resultUrl=f"/jobs/{job.id}/result",
+                                eventsUrl=f"/jobs/{job.id}/events"))
+        response.status_code = 202
+        response.headers['Location'] = f"/jobs/{job.id}"
+        return response
+    
+    except QueueFullError as e:
+        # Backpressure: the client should retry later rather than pile on
+        return jsonify({'success': False, 'error': str(e)}), 429, {'Retry-After': str(JOB_RETRY_AFTER)}
+    
+    except ImageNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    except InvalidParameterError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    except Exception as e:
+        print(f"Job submission error: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status and progress"""
+    if job_queue is None:
+        return jobs_disabled()
+    try:
+        return jsonify(dict(job_queue.get(job_id).to_dict(), success=True))
+    except JobNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    if job_queue is None:
+        return jobs_disabled()
+    try:
+        return jsonify(dict(job_queue.cancel(job_id).to_dict(), success=True))
+    except JobNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Fetch a finished job's response; 202 while it is still queued or running"""
+    if job_queue is None:
+        return jobs_disabled()
+    try:
+        job = job_queue.get(job_id)
+    except JobNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    if job.status == JOB_DONE:
+        return entry_response(job.result)
+    if job.status == JOB_FAILED:
+        return jsonify(dict(job.to_dict(), success=False)), 500
+    if job.status == JOB_CANCELLED:
+        return jsonify(dict(job.to_dict(), success=False, error='Job cancelled')), 410
+    return jsonify(dict(job.to_dict(), success=True)), 202
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events stream of a job's status until it finishes"""
+    if job_queue is None:
+        return jobs_disabled()
+    try:
+        job = job_queue.get(job_id)
+    except JobNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    
+    def stream():
+        version = None
+        while True:
+            current = job.wait(version, JOB_EVENTS_KEEPALIVE)
+            if current == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            status = job.to_dict()
+            yield f"event: status\ndata: {json.dumps(status)}\n\n"
+            if status['status'] in FINISHED_STATES:
+                return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss counters and memory usage"""
+    return jsonify({
+        'success': True,
+        'cache': result_cache.stats(),
+        'images': image_store.stats(),
+        'jobs': job_queue.stats() if job_queue is not None else None,
+        'clahe': hist_equalizer.clahe_pool.stats(),
+        'palettes': cartoonifier.palettes.stats()
+    })
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
-        'status': 'Complete DIP Suite API is running!', 
+        'status': 'Complete DIP Suite API is running!',
         'version': '2.1',
         'modules': ['compression', 'cartoonification', 'histogram_equalization']
     })
@@ -225,8 +929,13 @@ if __name__ == '__main__':
     print("📡 Server: http://localhost:5000")
     print("🔗 Health check: http://localhost:5000/health")
     print("📦 Available endpoints:")
+    print("  • /upload - Image Handle Upload")
     print("  • /compress - DCT Compression")
-    print("  • /cartoonify - Image Cartoonification") 
+    print("  • /compress/rd_curve - Rate-Distortion Curve")
+    print("  • /cartoonify - Image Cartoonification")
     print("  • /histogram_equalize - Histogram Equalization")
     print("  • /advanced_enhance - Advanced Enhancement Pipeline")
+    print("  • /batch/<operation> - Batch Processing (NDJSON stream)")
+    print("  • /jobs/<operation> - Async Jobs (poll, stream, cancel)")
+    print("  • /cache/stats - Result Cache Statistics")
     app.run(debug=True, port=5000, host='0.0.0.0')
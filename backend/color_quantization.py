@@ -0,0 +1,179 @@
+import cv2
+import numpy as np
+import threading
+from collections import OrderedDict
+
+# Palette strategies: 'kmeans' fits cv2.kmeans on a pixel subsample, 'median_cut' splits
+# the color box with the widest range at its median, 'minibatch' runs mini-batch k-means
+# over random batches of the whole image
+QUANTIZATION_STRATEGIES = ('kmeans', 'median_cut', 'minibatch')
+
+# Pixels used to fit a palette; assignment always covers every pixel
+DEFAULT_SAMPLE_SIZE = 16384
+# Pixels per distance computation when assigning labels, bounding the temporary matrix
+ASSIGN_CHUNK = 1 << 18
+# Lloyd iterations used to adapt a cached palette to a re-filtered image
+REFINE_ITERATIONS = 2
+
+class PaletteCache:
+    def __init__(self, max_entries=256):
+        """Thread-safe LRU of fitted palettes, so repeated requests on one image skip clustering"""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Cached palette for key, or None"""
+        with self._lock:
+            palette = self._entries.get(key)
+            if palette is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return palette
+
+    def put(self, key, palette):
+        """Store a palette, evicting the least recently used beyond max_entries"""
+        palette = np.float32(palette)
+        palette.setflags(write=False)
+        with self._lock:
+            self._entries[key] = palette
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters and entry count"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+class ColorQuantizer:
+    def __init__(self, strategy='kmeans', sample_size=DEFAULT_SAMPLE_SIZE, seed=0, attempts=3, iterations=20,
+                 batch_size=1024, batches=100, palette_cache=None):
+        """Reduce an RGB image to a small palette; a fixed seed makes the output reproducible
+        (palette_cache: optional PaletteCache used by quantize calls that pass a cache_key)"""
+        if strategy not in QUANTIZATION_STRATEGIES:
+            raise ValueError(f"Unknown quantization strategy: {strategy}")
+        self.strategy = strategy
+        self.sample_size = sample_size
+        self.seed = seed
+        self.attempts = attempts
+        self.iterations = iterations
+        self.batch_size = batch_size
+        self.batches = batches
+        self.palette_cache = palette_cache
+
+    def quantize(self, image, colors, strategy=None, cache_key=None, fit_image=None):
+        """Replace each pixel of image by the nearest of `colors` palette entries. With a
+        cache_key, a base palette is fitted once on fit_image (default: image) and cached for
+        the same key, colors and strategy; each call then refines a copy of it on image, so
+        the output never depends on which requests came before"""
+        pixels = image.reshape(-1, 3)
+        if cache_key is None or self.palette_cache is None:
+            palette = self.palette(pixels, colors, strategy)
+        else:
+            cache_key = (cache_key, int(colors), strategy or self.strategy)
+            base = self.palette_cache.get(cache_key)
+            if base is None:
+                fit_pixels = pixels if fit_image is None else fit_image.reshape(-1, 3)
+                base = self.palette(fit_pixels, colors, strategy)
+                self.palette_cache.put(cache_key, base)
+            palette = self.refine(self.sample(pixels, np.random.default_rng(self.seed)), base)
+        labels = self.assign(pixels, palette)
+        return np.uint8(palette)[labels].reshape(image.shape)
+
+    def palette(self, pixels, colors, strategy=None):
+        """Fit a float32 palette of at most `colors` entries to an (N, 3) pixel array"""
+        strategy = strategy or self.strategy
+        rng = np.random.default_rng(self.seed)
+        sample = self.sample(pixels, rng)
+        colors = max(1, min(int(colors), len(sample)))
+
+        if strategy == 'kmeans':
+            return self.kmeans_palette(sample, colors)
+        elif strategy == 'median_cut':
+            return self.median_cut_palette(sample, colors)
+        elif strategy == 'minibatch':
+            return self.minibatch_palette(pixels, colors, rng)
+        raise ValueError(f"Unknown quantization strategy: {strategy}")
+
+    def sample(self, pixels, rng):
+        """Random float32 subsample of the pixels (all of them for small images)"""
+        if len(pixels) <= self.sample_size:
+            return np.float32(pixels)
+        return np.float32(pixels[rng.integers(0, len(pixels), self.sample_size)])
+
+    def kmeans_palette(self, sample, colors):
+        """cv2.kmeans with k-means++ seeding on the subsample"""
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, self.iterations, 1.0)
+        # OpenCV's RNG is per thread, so seeding it here only affects this call
+        cv2.setRNGSeed(self.seed)
+        _, _, centers = cv2.kmeans(sample, colors, None, criteria, self.attempts, cv2.KMEANS_PP_CENTERS)
+        return centers
+
+    def median_cut_palette(self, sample, colors):
+        """Split the box with the widest channel range at its median until there are `colors` boxes"""
+        boxes = [sample]
+        while len(boxes) < colors:
+            ranges = [np.ptp(box, axis=0).max() if len(box) > 1 else -1 for box in boxes]
+            widest = int(np.argmax(ranges))
+            if ranges[widest] <= 0:
+                break
+            box = boxes.pop(widest)
+            channel = int(np.argmax(np.ptp(box, axis=0)))
+            order = np.argsort(box[:, channel], kind='stable')
+            half = len(box) // 2
+            boxes += [box[order[:half]], box[order[half:]]]
+        return np.float32([box.mean(axis=0) for box in boxes])
+
+    def minibatch_palette(self, pixels, colors, rng):
+        """Mini-batch k-means: centers move toward random batches with per-center decaying rates"""
+        centers = self.plus_plus_centers(self.sample(pixels, rng), colors, rng)
+        counts = np.zeros(colors)
+        for _ in range(self.batches):
+            batch = np.float32(pixels[rng.integers(0, len(pixels), self.batch_size)])
+            labels = self.assign(batch, centers)
+            counts += np.bincount(labels, minlength=colors)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, batch)
+            hits = np.bincount(labels, minlength=colors)
+            moved = hits > 0
+            rate = (hits[moved] / counts[moved])[:, None]
+            centers[moved] += rate * (sums[moved] / hits[moved][:, None] - centers[moved])
+        return centers
+
+    def refine(self, sample, palette, iterations=REFINE_ITERATIONS):
+        """A few Lloyd iterations starting from an existing palette; empty entries keep their color"""
+        palette = np.float32(palette).copy()
+        for _ in range(iterations):
+            labels = self.assign(sample, palette)
+            hits = np.bincount(labels, minlength=len(palette))
+            sums = np.stack([np.bincount(labels, weights=sample[:, c], minlength=len(palette)) for c in range(3)], 1)
+            moved = hits > 0
+            palette[moved] = sums[moved] / hits[moved][:, None]
+        return palette
+
+    def plus_plus_centers(self, sample, colors, rng):
+        """k-means++ seeding: each new center is drawn with probability proportional to squared distance"""
+        centers = [sample[rng.integers(len(sample))]]
+        distances = ((sample - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, colors):
+            total = distances.sum()
+            index = rng.choice(len(sample), p=distances / total) if total > 0 else rng.integers(len(sample))
+            centers.append(sample[index])
+            distances = np.minimum(distances, ((sample - sample[index]) ** 2).sum(axis=1))
+        return np.float32(centers)
+
+    def assign(self, pixels, palette):
+        """Index of the nearest palette entry for each pixel, computed in chunks as
+        |p|^2 - 2 p.c + |c|^2 with the |p|^2 term dropped (it does not change the argmin)"""
+        palette = np.float32(palette)
+        norms = (palette ** 2).sum(axis=1)
+        labels = np.empty(len(pixels), dtype=np.intp)
+        for start in range(0, len(pixels), ASSIGN_CHUNK):
+            chunk = np.float32(pixels[start:start + ASSIGN_CHUNK])
+            labels[start:start + len(chunk)] = np.argmin(norms - 2 * chunk @ palette.T, axis=1)
+        return labels
@@ -1,54 +1,201 @@
 import numpy as np
 import cv2
-from PIL import Image
-import matplotlib.pyplot as plt
-from scipy.fftpack import dct, idct
-import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from entropy_coding import encode_coefficients, decode_coefficients, pack_bitstream, unpack_bitstream
+from entropy_coding import COLOR_MODE_RGB, COLOR_MODE_YCBCR
+
+# Bounded caches for the per-(block_size, quality) tables; real traffic only
+# uses a handful of combinations so nearly every request is a cache hit
+BASIS_CACHE_SIZE = 8
+QUANT_CACHE_SIZE = 32
+
+# Quality range searched by compress_to_target and accepted by the encoder
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+
+# Accepted block sizes: quantized DC differences reach 255 * B, and the bitstream stores
+# them and the AC values as int16, so B = 64 keeps every symbol representable
+MIN_BLOCK_SIZE = 2
+MAX_BLOCK_SIZE = 64
+
+# Default quality sweep for rate-distortion curves
+RD_CURVE_QUALITIES = tuple(range(10, 100, 5))
+
+# Size of the int32 scratch buffer used by calculate_error_metrics, in elements
+METRICS_SCRATCH_ELEMENTS = 1 << 20
+
+# Bands a channel is split into when progress is reported, so updates arrive
+# during a plane rather than only after it
+PROGRESS_BANDS = 8
+
+def scaled_progress(progress, start, span):
+    """Map a stage's progress(0..1) callback onto [start, start + span] of an overall one"""
+    if progress is None:
+        return None
+    return lambda fraction: progress(start + span * fraction)
+
+@lru_cache(maxsize=BASIS_CACHE_SIZE)
+def dct_basis_matrix(block_size, dtype=np.float64):
+    """Orthonormal DCT-II basis matrix C, so that DCT(X) = C @ X @ C.T"""
+    k = np.arange(block_size)[:, None]
+    n = np.arange(block_size)[None, :]
+    basis = np.cos(np.pi * (2 * n + 1) * k / (2 * block_size)) * np.sqrt(2.0 / block_size)
+    basis[0, :] = np.sqrt(1.0 / block_size)
+    basis = basis.astype(dtype)
+    basis.setflags(write=False)
+    return basis
+
+# Quantization table ids as stored in the bitstream plane descriptors
+QUANT_TABLES = ('luma', 'chroma')
+
+# Colour modes and chroma subsampling factors (vertical, horizontal)
+COLOR_MODES = {'rgb': COLOR_MODE_RGB, 'ycbcr': COLOR_MODE_YCBCR}
+SUBSAMPLING_FACTORS = {'4:4:4': (1, 1), '4:2:2': (1, 2), '4:2:0': (2, 2)}
+
+# Smallest band worth handing to a worker thread, in block rows
+MIN_BAND_BLOCK_ROWS = 16
+
+@lru_cache(maxsize=QUANT_CACHE_SIZE)
+def quantization_matrix(quality, block_size, table='luma'):
+    """Quantization table for the given quality (1-100), block size and table"""
+    if table not in QUANT_TABLES:
+        raise ValueError(f"Unknown quantization table: {table}")
+    
+    # Standard JPEG quantization matrices for 8x8
+    if block_size == 8 and table == 'chroma':
+        base_matrix = np.array([
+            [17, 18, 24, 47, 99, 99, 99, 99],
+            [18, 21, 26, 66, 99, 99, 99, 99],
+            [24, 26, 56, 99, 99, 99, 99, 99],
+            [47, 66, 99, 99, 99, 99, 99, 99],
+            [99, 99, 99, 99, 99, 99, 99, 99],
+            [99, 99, 99, 99, 99, 99, 99, 99],
+            [99, 99, 99, 99, 99, 99, 99, 99],
+            [99, 99, 99, 99, 99, 99, 99, 99]
+        ])
+    elif block_size == 8:
+        base_matrix = np.array([
+            [16, 11, 10, 16, 24, 40, 51, 61],
+            [12, 12, 14, 19, 26, 58, 60, 55],
+            [14, 13, 16, 24, 40, 57, 69, 56],
+            [14, 17, 22, 29, 51, 87, 80, 62],
+            [18, 22, 37, 56, 68, 109, 103, 77],
+            [24, 35, 55, 64, 81, 104, 113, 92],
+            [49, 64, 78, 87, 103, 121, 120, 101],
+            [72, 92, 95, 98, 112, 100, 103, 99]
+        ])
+    else:
+        # Generate matrix for other block sizes
+        index = np.arange(block_size)
+        base_matrix = 1 + np.add.outer(index, index) * 0.5
+        if table == 'chroma':
+            # Chroma tolerates coarser steps, as in the 8x8 JPEG tables
+            base_matrix = base_matrix * 2
+    
+    # Scale based on quality (1-100)
+    if quality < 50:
+        scale = 5000 / quality
+    else:
+        scale = 200 - 2 * quality
+    
+    quant_matrix = np.floor((base_matrix * scale + 50) / 100)
+    quant_matrix = np.maximum(quant_matrix, 1)
+    quant_matrix.setflags(write=False)
+    
+    return quant_matrix
+
+class InvalidParameterError(ValueError):
+    """Raised for a quality or block size outside the range the encoder supports"""
 
 class DCTImageCompression:
-    def __init__(self):
+    def __init__(self, workers=1):
         """Initialize DCT Image Compression"""
-        pass
+        self.workers = max(1, int(workers))
+        self._executor = None
+        self._executor_lock = threading.Lock()
     
-    def dct2D(self, block):
-        """Perform 2D DCT on a block"""
-        return dct(dct(block.T, norm='ortho').T, norm='ortho')
+    def check_parameters(self, quality=None, block_size=None):
+        """Raise InvalidParameterError unless quality and block_size (where given) are in range"""
+        if quality is not None and not MIN_QUALITY <= quality <= MAX_QUALITY:
+            raise InvalidParameterError(f"quality must be between {MIN_QUALITY} and {MAX_QUALITY}, got {quality}")
+        if block_size is not None and not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            raise InvalidParameterError(
+                f"blockSize must be between {MIN_BLOCK_SIZE} and {MAX_BLOCK_SIZE}, got {block_size}"
+            )
     
-    def idct2D(self, block):
-        """Perform 2D Inverse DCT on a block"""
-        return idct(idct(block.T, norm='ortho').T, norm='ortho')
-    
-    def generate_quantization_matrix(self, quality, block_size):
-        """Generate quantization matrix based on quality"""
-        # Standard JPEG quantization matrix for 8x8
-        if block_size == 8:
-            base_matrix = np.array([
-                [16, 11, 10, 16, 24, 40, 51, 61],
-                [12, 12, 14, 19, 26, 58, 60, 55],
-                [14, 13, 16, 24, 40, 57, 69, 56],
-                [14, 17, 22, 29, 51, 87, 80, 62],
-                [18, 22, 37, 56, 68, 109, 103, 77],
-                [24, 35, 55, 64, 81, 104, 113, 92],
-                [49, 64, 78, 87, 103, 121, 120, 101],
-                [72, 92, 95, 98, 112, 100, 103, 99]
-            ])
-        else:
-            # Generate matrix for other block sizes
-            base_matrix = np.ones((block_size, block_size))
-            for i in range(block_size):
-                for j in range(block_size):
-                    base_matrix[i, j] = 1 + (i + j) * 0.5
-        
-        # Scale based on quality (1-100)
-        if quality < 50:
-            scale = 5000 / quality
-        else:
-            scale = 200 - 2 * quality
+    def get_executor(self):
+        """Thread pool shared by all band-parallel calls, created on first use"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='dct-band')
+            return self._executor
+    
+    def band_ranges(self, h, block_size, workers):
+        """Split h rows into block-aligned [start, stop) bands, at most one per worker"""
+        nblocks_y = -(-h // block_size)
+        bands = max(1, min(workers, nblocks_y // MIN_BAND_BLOCK_ROWS))
+        rows_per_band = -(-nblocks_y // bands) * block_size
+        return [(start, min(start + rows_per_band, h)) for start in range(0, h, rows_per_band)]
+    
+    def run_bands(self, h, block_size, workers, process_band, on_band=None):
+        """Call process_band(start, stop) for every band, concurrently when workers > 1.
         
-        quant_matrix = np.floor((base_matrix * scale + 50) / 100)
-        quant_matrix = np.maximum(quant_matrix, 1)
+        on_band(rows) is called from the calling thread as each band completes;
+        an exception it raises (e.g. a cancellation) stops the remaining bands.
+        """
+        workers = self.workers if workers is None else max(1, int(workers))
+        bands = self.band_ranges(h, block_size, max(workers, PROGRESS_BANDS) if on_band else workers)
+        if workers == 1 or len(bands) == 1:
+            for start, stop in bands:
+                process_band(start, stop)
+                if on_band:
+                    on_band(stop - start)
+            return
+        
+        # NumPy releases the GIL in the matmuls and ufuncs, so threads scale;
+        # each band writes straight into its slice of the caller's output
+        futures = [self.get_executor().submit(process_band, start, stop) for start, stop in bands]
+        try:
+            for future, (start, stop) in zip(futures, bands):
+                future.result()
+                if on_band:
+                    on_band(stop - start)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    
+    def plane_progress(self, planes, progress):
+        """Per-plane on_band callbacks that report overall progress(fraction) by pixels processed"""
+        if progress is None:
+            return [None] * len(planes)
+        total = sum(plane.size for plane, _ in planes)
+        done = [0]
         
-        return quant_matrix
+        def band_callback(width):
+            def on_band(rows):
+                done[0] += rows * width
+                progress(done[0] / total)
+            return on_band
+        
+        return [band_callback(plane.shape[1]) for plane, _ in planes]
+    
+    def dct2D(self, block):
+        """Perform 2D DCT on a block (or a stack of blocks)"""
+        basis = dct_basis_matrix(block.shape[-1], np.float32 if block.dtype == np.float32 else np.float64)
+        return basis @ block @ basis.T
+    
+    def idct2D(self, block):
+        """Perform 2D Inverse DCT on a block (or a stack of blocks)"""
+        basis = dct_basis_matrix(block.shape[-1], np.float32 if block.dtype == np.float32 else np.float64)
+        return basis.T @ block @ basis
+    
+    def generate_quantization_matrix(self, quality, block_size, table='luma'):
+        """Generate quantization matrix based on quality (cached, read-only)"""
+        return quantization_matrix(quality, block_size, table)
     
     def extract_block(self, image, x, y, block_size):
         """Extract a block from the image"""
@@ -73,13 +220,13 @@ class DCTImageCompression:
                 pos_y = min(y + j, w - 1)
                 image[pos_x, pos_y] = np.clip(block[i, j], 0, 255)
     
-    def compress_channel(self, channel, quality, block_size):
+    def compress_channel(self, channel, quality, block_size, table='luma'):
         """Compress a single color channel"""
         h, w = channel.shape
         compressed = np.copy(channel).astype(np.float64)
         
         # Generate quantization matrix
-        quant_matrix = self.generate_quantization_matrix(quality, block_size)
+        quant_matrix = self.generate_quantization_matrix(quality, block_size, table)
         
         # Process each block
         for i in range(0, h, block_size):
@@ -108,7 +255,87 @@ class DCTImageCompression:
         
         return compressed.astype(np.uint8)
     
-    def compress_image(self, image_path, quality=50, block_size=8):
+    def pad_channel(self, channel, block_size):
+        """Pad a channel to a whole number of blocks by edge replication"""
+        h, w = channel.shape
+        pad_h = (-h) % block_size
+        pad_w = (-w) % block_size
+        return np.pad(channel, ((0, pad_h), (0, pad_w)), mode='edge')
+    
+    def channel_to_blocks(self, padded, block_size):
+        """View a padded channel as a (nblocks_y, nblocks_x, B, B) block array"""
+        ph, pw = padded.shape
+        blocks = padded.reshape(ph // block_size, block_size, pw // block_size, block_size)
+        return blocks.swapaxes(1, 2)
+    
+    def blocks_to_channel(self, blocks, h, w):
+        """Reassemble a block array into an h x w channel"""
+        nblocks_y, nblocks_x, block_size, _ = blocks.shape
+        padded = blocks.swapaxes(1, 2).reshape(nblocks_y * block_size, nblocks_x * block_size)
+        
+        # insert_block clamps out-of-range positions onto the last row/column,
+        # so the last write (the padded edge) is the value that survives there
+        channel = padded[:h, :w].copy()
+        channel[h - 1, :] = padded[-1, :w]
+        channel[:, w - 1] = padded[:h, -1]
+        channel[h - 1, w - 1] = padded[-1, -1]
+        return channel
+    
+    def forward_blocks(self, channel, block_size):
+        """Pad a channel and DCT every block, returning a (ny, nx, B, B) coefficient grid"""
+        # Pad once and view the channel as a grid of blocks
+        padded = self.pad_channel(channel.astype(np.float64), block_size)
+        blocks = self.channel_to_blocks(padded, block_size) - 128
+        
+        return self.dct2D(blocks)
+    
+    def quantize_blocks(self, dct_blocks, quant_matrix):
+        """Quantize a coefficient grid to integer levels"""
+        return np.round(dct_blocks / quant_matrix).astype(np.int32)
+    
+    def reconstruct_blocks(self, quantized, quant_matrix, h, w):
+        """Dequantize and inverse-DCT a quantized grid back into an h x w channel"""
+        idct_blocks = self.idct2D(quantized * quant_matrix)
+        
+        # Shift back and clip
+        idct_blocks = np.clip(idct_blocks + 128, 0, 255)
+        
+        return self.blocks_to_channel(idct_blocks, h, w).astype(np.uint8)
+    
+    def compress_channel_vectorized(self, channel, quality, block_size, table='luma', workers=None):
+        """Compress a single color channel with all blocks transformed in one batch"""
+        reconstructed, _ = self.quantize_channel(channel, quality, block_size, table, workers)
+        return reconstructed
+    
+    def quantize_channel(self, channel, quality, block_size, table='luma', workers=None, on_band=None):
+        """Quantize a channel band by band, returning its reconstruction and coefficient grid"""
+        h, w = channel.shape
+        
+        # Generate quantization matrix
+        quant_matrix = self.generate_quantization_matrix(quality, block_size, table)
+        
+        reconstructed = np.empty((h, w), dtype=np.uint8)
+        quantized = np.empty((-(-h // block_size), -(-w // block_size), block_size, block_size),
+                             dtype=np.int32)
+        
+        def process_band(start, stop):
+            # Bands start on block boundaries, so only the last one needs padding
+            dct_blocks = self.forward_blocks(channel[start:stop], block_size)
+            band_quantized = self.quantize_blocks(dct_blocks, quant_matrix)
+            quantized[start // block_size:start // block_size + band_quantized.shape[0]] = band_quantized
+            reconstructed[start:stop] = self.reconstruct_blocks(band_quantized, quant_matrix, stop - start, w)
+        
+        # DCT, quantize and inverse DCT over every block of each band at once
+        self.run_bands(h, block_size, workers, process_band, on_band)
+        
+        return reconstructed, quantized
+    
+    def encode_channel(self, channel, quality, block_size, table='luma', workers=None, on_band=None):
+        """Compress a channel and entropy-code its quantized coefficients"""
+        reconstructed, quantized = self.quantize_channel(channel, quality, block_size, table, workers, on_band)
+        return reconstructed, encode_coefficients(quantized)
+    
+    def compress_image(self, image_path, quality=50, block_size=8, vectorized=True):
         """Compress an entire image"""
         # Load image
         image = cv2.imread(image_path)
@@ -118,31 +345,342 @@ class DCTImageCompression:
         # Convert BGR to RGB
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
-        # Separate channels
-        r_channel = image[:, :, 0]
-        g_channel = image[:, :, 1]
-        b_channel = image[:, :, 2]
+        return self.compress_array(image, quality, block_size, vectorized)
+    
+    def open_stream_source(self, source, shape=None):
+        """Open an image for block-row reads without loading it into memory"""
+        if isinstance(source, np.ndarray):
+            return source
+        if str(source).endswith('.npy'):
+            return np.load(source, mmap_mode='r')
+        if shape is None:
+            raise ValueError("Raw image files need an explicit (height, width, channels) shape")
+        return np.memmap(source, dtype=np.uint8, mode='r', shape=tuple(shape))
+    
+    def compress_stream(self, source, output_path, quality=50, block_size=8, shape=None):
+        """Compress an image larger than RAM one block row at a time into a .npy file"""
+        image = self.open_stream_source(source, shape)
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        h, w, channels = image.shape
+        
+        # Float32 tables keep every temporary in single precision
+        quant_matrix = self.generate_quantization_matrix(quality, block_size).astype(np.float32)
+        output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=(h, w, channels))
+        
+        # Only one block row is resident at a time, so peak memory is O(width x block_size)
+        for start in range(0, h, block_size):
+            stop = min(start + block_size, h)
+            strip = np.asarray(image[start:stop])
+            for c in range(channels):
+                padded = self.pad_channel(strip[:, :, c].astype(np.float32), block_size)
+                dct_blocks = self.dct2D(self.channel_to_blocks(padded, block_size) - np.float32(128))
+                quantized = np.round(dct_blocks / quant_matrix)
+                output[start:stop, :, c] = self.reconstruct_blocks(quantized, quant_matrix, stop - start, w)
+        
+        output.flush()
+        return output
+    
+    def split_planes(self, image, color_mode='rgb', subsampling='4:2:0'):
+        """Split an RGB image into (plane, quantization table) pairs for a colour mode"""
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode: {color_mode}")
+        
+        if color_mode == 'rgb':
+            return [(image[:, :, c], 'luma') for c in range(3)]
+        
+        if subsampling not in SUBSAMPLING_FACTORS:
+            raise ValueError(f"Unknown chroma subsampling: {subsampling}")
+        factor_y, factor_x = SUBSAMPLING_FACTORS[subsampling]
+        h, w = image.shape[:2]
+        chroma_size = (-(-w // factor_x), -(-h // factor_y))
+        
+        # OpenCV orders the planes Y, Cr, Cb
+        ycrcb = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
+        planes = [(ycrcb[:, :, 0], 'luma')]
+        for c in (2, 1):
+            chroma = ycrcb[:, :, c]
+            if chroma_size != (w, h):
+                chroma = cv2.resize(chroma, chroma_size, interpolation=cv2.INTER_AREA)
+            planes.append((chroma, 'chroma'))
+        
+        return planes
+    
+    def merge_planes(self, planes, h, w, color_mode='rgb'):
+        """Combine compressed planes back into an h x w RGB image"""
+        if color_mode == 'rgb':
+            return np.stack(planes, axis=2)
+        
+        # Upsample Cb/Cr to full resolution and convert back to RGB
+        luma, cb, cr = [
+            plane if plane.shape == (h, w) else cv2.resize(plane, (w, h), interpolation=cv2.INTER_LINEAR)
+            for plane in planes
+        ]
+        ycrcb = np.stack([luma, cr, cb], axis=2)
+        
+        return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2RGB)
+    
+    def compress_array(self, image_array, quality=50, block_size=8, vectorized=True,
+                       color_mode='rgb', subsampling='4:2:0', workers=None):
+        """Compress an RGB image array already decoded in memory"""
+        image = np.asarray(image_array)
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Expected an RGB image array, got shape {image.shape}")
+        h, w = image.shape[:2]
+        
+        # Separate channels (R, G, B or subsampled Y, Cb, Cr)
+        planes = self.split_planes(image, color_mode, subsampling)
         
         # Compress each channel
-        compressed_r = self.compress_channel(r_channel, quality, block_size)
-        compressed_g = self.compress_channel(g_channel, quality, block_size)
-        compressed_b = self.compress_channel(b_channel, quality, block_size)
+        if vectorized:
+            compressed = [
+                self.compress_channel_vectorized(plane, quality, block_size, table, workers)
+                for plane, table in planes
+            ]
+        else:
+            compressed = [self.compress_channel(plane, quality, block_size, table) for plane, table in planes]
         
         # Combine channels
-        compressed_image = np.stack([compressed_r, compressed_g, compressed_b], axis=2)
+        compressed_image = self.merge_planes(compressed, h, w, color_mode)
         
         return image, compressed_image
     
-    def calculate_psnr(self, original, compressed):
-        """Calculate Peak Signal-to-Noise Ratio"""
-        mse = np.mean((original.astype(np.float64) - compressed.astype(np.float64)) ** 2)
+    def encode_array(self, image_array, quality=50, block_size=8, color_mode='rgb', subsampling='4:2:0',
+                     workers=None, progress=None):
+        """Compress an RGB image array and produce its entropy-coded bitstream"""
+        image = np.asarray(image_array)
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Expected an RGB image array, got shape {image.shape}")
+        h, w = image.shape[:2]
+        self.check_parameters(quality, block_size)
+        
+        planes = self.split_planes(image, color_mode, subsampling)
+        channels = []
+        descriptors = []
+        for (plane, table), on_band in zip(planes, self.plane_progress(planes, progress)):
+            reconstructed, payload = self.encode_channel(plane, quality, block_size, table, workers, on_band)
+            channels.append(reconstructed)
+            descriptors.append((plane.shape[0], plane.shape[1], QUANT_TABLES.index(table), payload))
+        
+        bitstream = pack_bitstream(h, w, block_size, quality, descriptors, COLOR_MODES[color_mode])
+        
+        return image, self.merge_planes(channels, h, w, color_mode), bitstream
+    
+    def decode_bitstream(self, bitstream):
+        """Decode a bitstream produced by encode_array back into an RGB image array"""
+        header, planes = unpack_bitstream(bitstream)
+        block_size = header['block_size']
+        color_mode = next(name for name, code in COLOR_MODES.items() if code == header['color_mode'])
+        
+        channels = []
+        for plane_h, plane_w, table_id, payload in planes:
+            quant_matrix = self.generate_quantization_matrix(
+                header['quality'], block_size, QUANT_TABLES[table_id]
+            )
+            nblocks_y = -(-plane_h // block_size)
+            nblocks_x = -(-plane_w // block_size)
+            quantized = decode_coefficients(payload, nblocks_y, nblocks_x, block_size)
+            channels.append(self.reconstruct_blocks(quantized, quant_matrix, plane_h, plane_w))
+        
+        return self.merge_planes(channels, header['height'], header['width'], color_mode)
+    
+    def transform_channel(self, channel, block_size, workers=None, on_band=None):
+        """Forward-DCT a whole channel band by band into a (ny, nx, B, B) coefficient grid"""
+        h, w = channel.shape
+        dct_blocks = np.empty((-(-h // block_size), -(-w // block_size), block_size, block_size))
+        
+        def process_band(start, stop):
+            band = self.forward_blocks(channel[start:stop], block_size)
+            dct_blocks[start // block_size:start // block_size + band.shape[0]] = band
+        
+        self.run_bands(h, block_size, workers, process_band, on_band)
+        return dct_blocks
+    
+    def transform_array(self, image_array, block_size=8, color_mode='rgb', subsampling='4:2:0', workers=None,
+                        progress=None):
+        """Forward-DCT every plane once so that many qualities can be tried cheaply"""
+        image = np.asarray(image_array)
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Expected an RGB image array, got shape {image.shape}")
+        self.check_parameters(block_size=block_size)
+        
+        split = self.split_planes(image, color_mode, subsampling)
+        planes = [
+            (self.transform_channel(plane, block_size, workers, on_band), table, plane.shape)
+            for (plane, table), on_band in zip(split, self.plane_progress(split, progress))
+        ]
+        
+        return {
+            'image': image,
+            'block_size': block_size,
+            'color_mode': color_mode,
+            'planes': planes
+        }
+    
+    def quantize_transformed(self, transformed, quality, reconstruct=True, encode=True):
+        """Quantize cached coefficients at one quality, returning (image, bitstream)"""
+        block_size = transformed['block_size']
+        color_mode = transformed['color_mode']
+        h, w = transformed['image'].shape[:2]
+        self.check_parameters(quality)
+        
+        channels = []
+        descriptors = []
+        for dct_blocks, table, (plane_h, plane_w) in transformed['planes']:
+            quant_matrix = self.generate_quantization_matrix(quality, block_size, table)
+            quantized = self.quantize_blocks(dct_blocks, quant_matrix)
+            if reconstruct:
+                channels.append(self.reconstruct_blocks(quantized, quant_matrix, plane_h, plane_w))
+            if encode:
+                descriptors.append((plane_h, plane_w, QUANT_TABLES.index(table), encode_coefficients(quantized)))
+        
+        compressed = self.merge_planes(channels, h, w, color_mode) if reconstruct else None
+        bitstream = pack_bitstream(h, w, block_size, quality, descriptors, COLOR_MODES[color_mode]) if encode else None
+        
+        return compressed, bitstream
+    
+    def compress_to_target(self, image_array, target_psnr=None, target_bytes=None, block_size=8,
+                           color_mode='rgb', subsampling='4:2:0', workers=None, progress=None):
+        """Binary-search the quality that meets a PSNR floor or a byte budget"""
+        if (target_psnr is None) == (target_bytes is None):
+            raise ValueError("Specify exactly one of target_psnr or target_bytes")
+        
+        # The forward DCT is done once; each probe only re-quantizes
+        transformed = self.transform_array(image_array, block_size, color_mode, subsampling, workers,
+                                           scaled_progress(progress, 0.0, 0.4))
+        original = transformed['image']
+        probes = [0]
+        max_probes = (MAX_QUALITY - MIN_QUALITY).bit_length() + 1
+        
+        def meets_target(quality):
+            probes[0] += 1
+            if progress is not None:
+                progress(0.4 + 0.6 * probes[0] / max_probes)
+            if target_psnr is not None:
+                compressed, _ = self.quantize_transformed(transformed, quality, encode=False)
+                return self.calculate_psnr(original, compressed) >= target_psnr
+            _, bitstream = self.quantize_transformed(transformed, quality, reconstruct=False)
+            return len(bitstream) <= target_bytes
+        
+        # PSNR grows and size grows with quality: find the lowest quality that
+        # reaches the PSNR target, or the highest one that fits the budget
+        low, high = MIN_QUALITY, MAX_QUALITY
+        if target_psnr is not None:
+            while low < high:
+                mid = (low + high) // 2
+                if meets_target(mid):
+                    high = mid
+                else:
+                    low = mid + 1
+        else:
+            while low < high:
+                mid = (low + high + 1) // 2
+                if meets_target(mid):
+                    low = mid
+                else:
+                    high = mid - 1
+        
+        compressed, bitstream = self.quantize_transformed(transformed, low)
+        
+        return original, compressed, bitstream, low
+    
+    def rate_distortion_curve(self, image_array, qualities=RD_CURVE_QUALITIES, block_size=8,
+                              color_mode='rgb', subsampling='4:2:0', workers=None, progress=None):
+        """PSNR, MSE and encoded size at each quality from a single forward transform"""
+        transformed = self.transform_array(image_array, block_size, color_mode, subsampling, workers,
+                                           scaled_progress(progress, 0.0, 0.3))
+        original = transformed['image']
+        
+        def evaluate(quality):
+            compressed, bitstream = self.quantize_transformed(transformed, quality)
+            metrics = self.calculate_error_metrics(original, compressed)
+            return {
+                'quality': quality,
+                'psnr': metrics['psnr'],
+                'mse': metrics['mse'],
+                'size': len(bitstream)
+            }
+        
+        # Points only read the shared coefficients, so they can run side by side
+        workers = self.workers if workers is None else max(1, int(workers))
+        if workers > 1 and len(qualities) > 1:
+            results = self.get_executor().map(evaluate, qualities)
+        else:
+            results = map(evaluate, qualities)
+        
+        points = []
+        for point in results:
+            points.append(point)
+            if progress is not None:
+                progress(0.3 + 0.7 * len(points) / len(qualities))
+        return points
+    
+    def psnr_from_mse(self, mse):
+        """Convert a Mean Squared Error into Peak Signal-to-Noise Ratio"""
         if mse == 0:
             return 100
         max_pixel = 255.0
         psnr = 20 * np.log10(max_pixel / np.sqrt(mse))
         return psnr
     
+    def calculate_error_metrics(self, original, compressed, per_channel=False, block_size=None):
+        """Calculate MSE and PSNR in one chunked pass, optionally with per-channel and per-block MSE"""
+        if original.shape != compressed.shape:
+            raise ValueError(f"Image shapes differ: {original.shape} vs {compressed.shape}")
+        
+        h, w = original.shape[:2]
+        channels = original.shape[2] if original.ndim == 3 else 1
+        row_elements = w * channels
+        
+        # Rows per chunk fill the scratch buffer; keep chunks block-aligned for the error map
+        chunk_rows = max(1, METRICS_SCRATCH_ELEMENTS // row_elements)
+        if block_size:
+            chunk_rows = max(block_size, chunk_rows // block_size * block_size)
+        # Squared differences of 8-bit images are exact in int32 (at most 255 ** 2); anything
+        # else (float reconstructions, 16-bit images) is accumulated in float64
+        exact = all(np.issubdtype(a.dtype, np.integer) and a.dtype.itemsize == 1 for a in (original, compressed))
+        diff_dtype, sum_dtype = (np.int32, np.int64) if exact else (np.float64, np.float64)
+        scratch = np.empty(chunk_rows * row_elements, dtype=diff_dtype)
+        
+        channel_sums = np.zeros(channels, dtype=sum_dtype)
+        if block_size:
+            block_rows = np.arange(0, h, block_size)
+            block_cols = np.arange(0, w, block_size)
+            block_sums = np.zeros((len(block_rows), len(block_cols)), dtype=sum_dtype)
+        
+        for start in range(0, h, chunk_rows):
+            stop = min(start + chunk_rows, h)
+            
+            squared = scratch[:(stop - start) * row_elements].reshape(stop - start, w, channels)
+            np.subtract(original[start:stop].reshape(stop - start, w, channels),
+                        compressed[start:stop].reshape(stop - start, w, channels),
+                        out=squared, dtype=diff_dtype)
+            np.multiply(squared, squared, out=squared)
+            channel_sums += squared.sum(axis=(0, 1), dtype=sum_dtype)
+            
+            if block_size:
+                pixel_sums = squared.sum(axis=2, dtype=sum_dtype)
+                row_starts = np.arange(0, stop - start, block_size)
+                sums = np.add.reduceat(np.add.reduceat(pixel_sums, row_starts, axis=0), block_cols, axis=1)
+                first = start // block_size
+                block_sums[first:first + len(row_starts)] += sums
+        
+        mse = float(channel_sums.sum()) / (h * w * channels)
+        metrics = {'mse': mse, 'psnr': self.psnr_from_mse(mse)}
+        
+        if per_channel:
+            metrics['channel_mse'] = (channel_sums / (h * w)).tolist()
+        if block_size:
+            block_heights = np.minimum(block_size, h - block_rows)
+            block_widths = np.minimum(block_size, w - block_cols)
+            metrics['block_mse'] = block_sums / (np.outer(block_heights, block_widths) * channels)
+        
+        return metrics
+    
+    def calculate_psnr(self, original, compressed):
+        """Calculate Peak Signal-to-Noise Ratio"""
+        return self.calculate_error_metrics(original, compressed)['psnr']
+    
     def calculate_mse(self, original, compressed):
         """Calculate Mean Squared Error"""
-        mse = np.mean((original.astype(np.float64) - compressed.astype(np.float64)) ** 2)
-        return mse
+        return self.calculate_error_metrics(original, compressed)['mse']
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+# Luma weights of PIL's RGB -> L conversion (16-bit fixed point), used for the contrast pivot
+LUMA_WEIGHTS = np.array([19595, 38470, 7471]) / 65536.0
+
+LEVELS = np.arange(256, dtype=np.float64)
+
+class EnhancementPipeline:
+    def __init__(self):
+        """Chain of enhancement stages applied to an RGB uint8 image. Consecutive point-wise
+        stages are composed into one 256-entry LUT per channel and applied in a single cv2.LUT
+        pass; spatial stages run as separate passes"""
+        self.stages = []
+
+    # Point-wise stages. Each table function maps the per-channel histograms of the stage
+    # input, shape (3, 256), to a 256-entry table or per-channel tables of shape (3, 256);
+    # histograms are only computed for passes containing a stage that needs them
+
+    def gamma(self, gamma):
+        """Gamma correction"""
+        if gamma != 1.0:
+            table = ((LEVELS / 255.0) ** (1.0 / gamma) * 255).astype(np.uint8)
+            self.lut(table)
+        return self
+
+    def equalize(self):
+        """Global histogram equalization of each channel (the mapping of cv2.equalizeHist)"""
+        self.stages.append(('point', lambda histograms: np.stack([equalize_table(h) for h in histograms]), True))
+        return self
+
+    def posterize(self, levels):
+        """Reduce each channel to the given number of levels"""
+        step = 256 // levels
+        self.lut((np.arange(256) // step) * step)
+        return self
+
+    def contrast(self, factor, pivot=None):
+        """Blend each level with pivot by factor as PIL's ImageEnhance.Contrast does (float32,
+        truncated); pivot defaults to the rounded mean luma of the stage input"""
+        def table(histograms):
+            center = pivot
+            if center is None:
+                # Mean of the per-channel means; PIL averages per-pixel rounded L values, which
+                # only differs when the mean lies within rounding error of a half level
+                means = histograms @ LEVELS / histograms.sum(axis=1)
+                center = int(LUMA_WEIGHTS @ means + 0.5)
+            blended = np.float32(center) + np.float32(factor) * (LEVELS.astype(np.float32) - np.float32(center))
+            return np.clip(blended, 0, 255).astype(np.uint8)
+        self.stages.append(('point', table, pivot is None))
+        return self
+
+    def lut(self, table):
+        """Fixed lookup table: 256 entries, or shape (3, 256) for per-channel tables"""
+        table = np.asarray(table, dtype=np.uint8)
+        self.stages.append(('point', lambda histograms: table, False))
+        return self
+
+    # Spatial stages
+
+    def unsharp(self, sigma=1.0, strength=1.5):
+        """Unsharp masking: image + strength * (image - blurred), saturated to uint8 in one pass"""
+        def run(image):
+            blurred = cv2.GaussianBlur(image, (0, 0), sigma)
+            return cv2.addWeighted(image, 1.0 + strength, blurred, -strength, 0)
+        return self.spatial(run)
+
+    def spatial(self, function):
+        """Arbitrary image -> image stage"""
+        self.stages.append(('spatial', function, False))
+        return self
+
+    def run(self, image, progress=None):
+        """Apply the stages to image; progress(fraction) is reported after each pass"""
+        passes = self.passes()
+        for i, (kind, stages) in enumerate(passes):
+            if kind == 'spatial':
+                image = stages[0][1](image)
+            else:
+                image = apply_point_stages(image, stages)
+            if progress:
+                progress((i + 1) / len(passes))
+        return image
+
+    def passes(self):
+        """Stages grouped into passes: each spatial stage alone, consecutive point stages together"""
+        passes = []
+        for stage in self.stages:
+            if stage[0] == 'point' and passes and passes[-1][0] == 'point':
+                passes[-1][1].append(stage)
+            else:
+                passes.append((stage[0], [stage]))
+        return passes
+
+def equalize_table(histogram):
+    """cv2.equalizeHist mapping for a 256-bin histogram"""
+    table = np.zeros(256, dtype=np.uint8)
+    nonzero = np.flatnonzero(histogram)
+    if len(nonzero) == 0:
+        return table
+    first = nonzero[0]
+    total = histogram.sum()
+    if histogram[first] == total:
+        table[:] = first
+        return table
+
+    scale = np.float32(255.0 / (total - histogram[first]))
+    cumulative = np.cumsum(histogram[first + 1:])
+    table[first + 1:] = np.clip(np.rint(cumulative.astype(np.float32) * scale), 0, 255)
+    return table
+
+def apply_point_stages(image, stages):
+    """Compose point stages into per-channel tables and apply them with one cv2.LUT call"""
+    composed = np.tile(np.arange(256, dtype=np.uint8), (3, 1))
+    histograms = None
+    if any(needs_histogram for _, _, needs_histogram in stages):
+        histograms = np.stack([cv2.calcHist([image], [c], None, [256], [0, 256]).ravel() for c in range(3)])
+        histograms = histograms.astype(np.float64)
+
+    for _, table_for, needs_histogram in stages:
+        stage_histograms = None
+        if needs_histogram:
+            # Histogram of the stage input: the original counts moved through the tables so far
+            stage_histograms = np.stack([np.bincount(composed[c], weights=histograms[c], minlength=256)
+                                         for c in range(3)])
+        table = np.broadcast_to(np.asarray(table_for(stage_histograms), dtype=np.uint8), (3, 256))
+        composed = np.take_along_axis(table, composed.astype(np.intp), axis=1)
+
+    return cv2.LUT(image, np.ascontiguousarray(composed.T).reshape(1, 256, 3))
@@ -0,0 +1,146 @@
+import numpy as np
+import struct
+import zlib
+from functools import lru_cache
+
+# Container layout (little-endian):
+#   header: magic, version, color mode, block size, quality, plane count, height, width
+#   per plane: plane height, plane width, quantization table id, payload length
+#   followed by the plane payloads in the same order
+MAGIC = b'DCTB'
+VERSION = 1
+HEADER_FORMAT = '<4sBBHBBII'
+PLANE_FORMAT = '<IIBI'
+
+COLOR_MODE_RGB = 0
+COLOR_MODE_YCBCR = 1
+
+@lru_cache(maxsize=8)
+def zigzag_indices(block_size):
+    """Flat indices of a B x B block in JPEG zigzag order"""
+    order = sorted(
+        ((i, j) for i in range(block_size) for j in range(block_size)),
+        key=lambda p: (p[0] + p[1], p[1] if (p[0] + p[1]) % 2 == 0 else p[0])
+    )
+    indices = np.array([i * block_size + j for i, j in order])
+    indices.setflags(write=False)
+    return indices
+
+def _shuffle_bytes(array):
+    """Serialize an integer array with its bytes grouped by significance"""
+    array = np.ascontiguousarray(array)
+    return array.view(np.uint8).reshape(-1, array.itemsize).T.tobytes()
+
+def _unshuffle_bytes(data, dtype, count, offset=0):
+    """Inverse of _shuffle_bytes, reading count items starting at a byte offset"""
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(data, dtype=np.uint8, count=count * dtype.itemsize, offset=offset)
+    return planes.reshape(dtype.itemsize, count).T.copy().view(dtype).ravel()
+
+def _run_dtype(block_size):
+    """Smallest unsigned type that can hold a zero run inside one block"""
+    return np.uint8 if block_size * block_size <= 256 else np.uint16
+
+def encode_coefficients(quantized_blocks):
+    """Entropy-code a (nblocks_y, nblocks_x, B, B) grid of quantized coefficients"""
+    block_size = quantized_blocks.shape[-1]
+    zigzag = quantized_blocks.reshape(-1, block_size * block_size)[:, zigzag_indices(block_size)]
+
+    # DC coefficients are coded as differences from the previous block
+    dc_diff = np.diff(zigzag[:, 0], prepend=0).astype(np.int16)
+
+    # AC coefficients become (zero run, value) pairs plus a per-block count,
+    # which plays the role of JPEG's end-of-block marker
+    ac = zigzag[:, 1:]
+    rows, cols = np.nonzero(ac)
+    counts = np.bincount(rows, minlength=ac.shape[0]).astype(np.uint16)
+    previous = np.empty_like(cols)
+    previous[1:] = cols[:-1]
+    block_start = np.ones(len(rows), dtype=bool)
+    block_start[1:] = rows[1:] != rows[:-1]
+    previous[block_start] = -1
+    runs = (cols - previous - 1).astype(_run_dtype(block_size))
+    values = ac[rows, cols].astype(np.int16)
+
+    # DEFLATE supplies the Huffman stage over the symbol streams; its RLE
+    # strategy skips the costly LZ77 match search and compresses best here
+    stream = b''.join([
+        _shuffle_bytes(dc_diff),
+        _shuffle_bytes(counts),
+        _shuffle_bytes(runs),
+        _shuffle_bytes(values),
+    ])
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+    return compressor.compress(stream) + compressor.flush()
+
+def decode_coefficients(payload, nblocks_y, nblocks_x, block_size):
+    """Decode a plane payload back into a grid of quantized coefficients"""
+    stream = zlib.decompress(payload)
+    nblocks = nblocks_y * nblocks_x
+    run_dtype = np.dtype(_run_dtype(block_size))
+
+    offset = 0
+    dc_diff = _unshuffle_bytes(stream, np.int16, nblocks, offset)
+    offset += nblocks * 2
+    counts = _unshuffle_bytes(stream, np.uint16, nblocks, offset)
+    offset += nblocks * 2
+    total = int(counts.sum())
+    runs = _unshuffle_bytes(stream, run_dtype, total, offset)
+    offset += total * run_dtype.itemsize
+    values = _unshuffle_bytes(stream, np.int16, total, offset)
+
+    coefficients = block_size * block_size
+    blocks = np.zeros((nblocks, coefficients), dtype=np.int32)
+    blocks[:, 0] = np.cumsum(dc_diff.astype(np.int32))
+
+    # Zigzag positions are the running sum of (run + 1) restarted at every
+    # block; scatter the values straight to their natural-order positions
+    steps = runs.astype(np.int64) + 1
+    position = np.cumsum(steps)
+    nonempty = counts > 0
+    first = (np.cumsum(counts.astype(np.int64)) - counts)[nonempty]
+    position -= np.repeat((position - steps)[first], counts[nonempty])
+    block_offset = np.repeat(np.arange(nblocks, dtype=np.int64) * coefficients, counts)
+    blocks.ravel()[block_offset + zigzag_indices(block_size)[position]] = values
+
+    return blocks.reshape(nblocks_y, nblocks_x, block_size, block_size)
+
+def pack_bitstream(height, width, block_size, quality, planes, color_mode=COLOR_MODE_RGB):
+    """Assemble the binary container from (plane_h, plane_w, table_id, payload) tuples"""
+    parts = [struct.pack(HEADER_FORMAT, MAGIC, VERSION, color_mode, block_size,
+                         quality, len(planes), height, width)]
+    for plane_h, plane_w, table_id, payload in planes:
+        parts.append(struct.pack(PLANE_FORMAT, plane_h, plane_w, table_id, len(payload)))
+    parts.extend(payload for _, _, _, payload in planes)
+    return b''.join(parts)
+
+def unpack_bitstream(data):
+    """Parse a container into its header fields and plane descriptors"""
+    magic, version, color_mode, block_size, quality, nplanes, height, width = \
+        struct.unpack_from(HEADER_FORMAT, data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a DCT bitstream")
+    if version != VERSION:
+        raise ValueError(f"Unsupported DCT bitstream version: {version}")
+    if color_mode not in (COLOR_MODE_RGB, COLOR_MODE_YCBCR):
+        raise ValueError(f"Unknown DCT bitstream color mode: {color_mode}")
+
+    offset = struct.calcsize(HEADER_FORMAT)
+    descriptors = []
+    for _ in range(nplanes):
+        descriptors.append(struct.unpack_from(PLANE_FORMAT, data, offset))
+        offset += struct.calcsize(PLANE_FORMAT)
+
+    planes = []
+    for plane_h, plane_w, table_id, length in descriptors:
+        planes.append((plane_h, plane_w, table_id, data[offset:offset + length]))
+        offset += length
+
+    header = {
+        'color_mode': color_mode,
+        'block_size': block_size,
+        'quality': quality,
+        'height': height,
+        'width': width
+    }
+    return header, planes
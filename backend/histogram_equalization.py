@@ -1,17 +1,96 @@
 import cv2
 import numpy as np
 from PIL import Image, ImageEnhance
-import matplotlib.pyplot as plt
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+from image_planes import ImagePlanes
+from enhancement_pipeline import EnhancementPipeline
 import io
 import base64
+import threading
+
+# pyplot keeps global figure state, so plots are drawn one at a time
+PLOT_LOCK = threading.Lock()
+
+# Histogram payloads: 'data' returns only the 256-bin arrays, 'image' adds plots
+# drawn directly with OpenCV, 'matplotlib' adds the original pyplot figures
+HISTOGRAM_FORMATS = ('data', 'image', 'matplotlib')
+
+# RGB plot colors for render_histogram
+HISTOGRAM_COLORS = {
+    'red': (239, 68, 68),
+    'green': (16, 185, 129),
+    'blue': (59, 130, 246)
+}
+
+# Multi-Scale Retinex: 'exact' blurs the full-resolution float64 image at every scale;
+# 'fast' works in float32 and blurs large sigmas on a downsampled copy, staying within
+# 3 gray levels of 'exact' (under 1 on average) at 50-100x the speed on large images
+RETINEX_MODES = ('fast', 'exact')
+# Smallest surround sigma, in pixels of the downsampled copy, used by the fast mode
+RETINEX_MIN_SIGMA = 8
+
+@lru_cache(maxsize=None)
+def pyplot():
+    """Import pyplot on first use with the headless Agg backend (matplotlib costs ~0.5s to import)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+class ClahePool:
+    def __init__(self, max_settings=32, max_idle=4):
+        """Thread-safe pool of CLAHE operators keyed by (clipLimit, tileGridSize)"""
+        self.max_settings = max_settings
+        self.max_idle = max_idle
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    @contextmanager
+    def acquire(self, clip_limit, tile_grid_size):
+        """Borrow an operator for these settings; a CLAHE object keeps per-call state, so each
+        one is lent to a single thread at a time and returned to the pool afterwards"""
+        key = (float(clip_limit), int(tile_grid_size))
+        with self._lock:
+            idle = self._idle.get(key)
+            clahe = idle.pop() if idle else None
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=key[0], tileGridSize=(key[1], key[1]))
+            with self._lock:
+                self.created += 1
+        try:
+            yield clahe
+        finally:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                self._idle.move_to_end(key)
+                if len(idle) < self.max_idle:
+                    idle.append(clahe)
+                # Forget the least recently used settings (e.g. from a clip-limit slider sweep)
+                while len(self._idle) > self.max_settings:
+                    self._idle.popitem(last=False)
+
+    def stats(self):
+        """Pooled settings, idle operators and operators created so far"""
+        with self._lock:
+            return {
+                'settings': len(self._idle),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'created': self.created
+            }
 
 class HistogramEqualization:
     def __init__(self):
         """Initialize Histogram Equalization module"""
-        pass
+        # CLAHE operators are reused across requests with the same settings
+        self.clahe_pool = ClahePool()
     
-    def calculate_histogram(self, image_array, channel='gray'):
-        """Calculate histogram for given channel"""
+    def calculate_histogram(self, image_array, channel='gray', planes=None):
+        """Calculate histogram for given channel (planes: optional ImagePlanes of image_array)"""
+        if planes is not None:
+            return planes.histogram(channel)
         if channel == 'gray':
             gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
             hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
@@ -32,6 +111,10 @@ class HistogramEqualization:
     
     def create_histogram_visualization(self, histogram, color='blue', title='Histogram'):
         """Create histogram visualization image"""
+        with PLOT_LOCK:
+            return self._plot_histogram(pyplot(), histogram, color, title)
+    
+    def _plot_histogram(self, plt, histogram, color, title):
         plt.figure(figsize=(8, 6))
         plt.clf()
         
@@ -56,6 +139,63 @@ class HistogramEqualization:
         
         return f"data:image/png;base64,{plot_base64}"
     
+    def render_histogram(self, histogram, color='blue', title='Histogram', width=640, height=400):
+        """Rasterize a histogram plot straight into a PNG data URL with OpenCV"""
+        rgb = HISTOGRAM_COLORS.get(color, HISTOGRAM_COLORS['blue'])
+        plot = np.full((height, width, 3), 255, dtype=np.uint8)
+        left, top = 48, 36
+        plot_w, plot_h = width - left - 16, height - top - 40
+        bottom = top + plot_h
+        
+        # Horizontal grid lines
+        for i in range(1, 4):
+            y = top + plot_h * i // 4
+            cv2.line(plot, (left, y), (left + plot_w, y), (230, 230, 230), 1)
+        
+        # Curve and translucent fill under it, scaled to the tallest bin
+        histogram = np.asarray(histogram, dtype=np.float64).ravel()
+        peak = max(histogram.max(), 1.0)
+        xs = left + np.arange(len(histogram)) * (plot_w / (len(histogram) - 1))
+        ys = bottom - histogram / peak * plot_h
+        curve = np.round(np.stack([xs, ys], axis=1)).astype(np.int32)
+        area = np.vstack([[[left, bottom]], curve, [[left + plot_w, bottom]]])
+        fill = plot.copy()
+        cv2.fillPoly(fill, [area], rgb)
+        cv2.addWeighted(fill, 0.3, plot, 0.7, 0, dst=plot)
+        cv2.polylines(plot, [curve], False, rgb, 2, cv2.LINE_AA)
+        cv2.rectangle(plot, (left, top), (left + plot_w, bottom), (120, 120, 120), 1)
+        
+        # Title and intensity axis labels
+        text = (40, 40, 40)
+        cv2.putText(plot, title, (left, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, text, 1, cv2.LINE_AA)
+        cv2.putText(plot, '0', (left - 4, bottom + 18), cv2.FONT_HERSHEY_SIMPLEX, 0.45, text, 1, cv2.LINE_AA)
+        cv2.putText(plot, '255', (left + plot_w - 24, bottom + 18), cv2.FONT_HERSHEY_SIMPLEX, 0.45, text, 1,
+                    cv2.LINE_AA)
+        cv2.putText(plot, 'Pixel Intensity', (left + plot_w // 2 - 60, bottom + 32), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.45, text, 1, cv2.LINE_AA)
+        
+        _, png = cv2.imencode('.png', cv2.cvtColor(plot, cv2.COLOR_RGB2BGR))
+        return f"data:image/png;base64,{base64.b64encode(png.tobytes()).decode()}"
+    
+    def histogram_payload(self, original_hist, enhanced_hist, histogram_format='image',
+                          enhanced_title='Enhanced Histogram'):
+        """Histogram response data: the 256-bin arrays, plus plots unless the format is 'data'"""
+        if histogram_format not in HISTOGRAM_FORMATS:
+            raise ValueError(f"Unknown histogram format: {histogram_format}")
+        
+        # Bin counts are whole numbers; integer lists keep the data small enough for the
+        # metadata header of binary responses
+        histogram_data = {
+            'originalData': np.int64(original_hist).tolist(),
+            'enhancedData': np.int64(enhanced_hist).tolist()
+        }
+        if histogram_format != 'data':
+            draw = self.create_histogram_visualization if histogram_format == 'matplotlib' else self.render_histogram
+            histogram_data['original'] = draw(original_hist, 'red', 'Original Histogram')
+            histogram_data['enhanced'] = draw(enhanced_hist, 'green', enhanced_title)
+        
+        return histogram_data
+    
     def global_histogram_equalization(self, image_array):
         """Apply global histogram equalization"""
         print("Applying global histogram equalization...")
@@ -69,44 +209,44 @@ class HistogramEqualization:
         
         return equalized
     
-    def adaptive_histogram_equalization(self, image_array, tile_grid_size=8):
+    def adaptive_histogram_equalization(self, image_array, tile_grid_size=8, planes=None):
         """Apply adaptive histogram equalization (AHE)"""
         print(f"Applying adaptive histogram equalization with tile size {tile_grid_size}...")
         
         # Convert to YUV color space to preserve color information
-        yuv = cv2.cvtColor(image_array, cv2.COLOR_RGB2YUV)
+        yuv = planes.plane('yuv').copy() if planes is not None else cv2.cvtColor(image_array, cv2.COLOR_RGB2YUV)
         
         # Apply AHE to Y channel only
-        clahe = cv2.createCLAHE(clipLimit=40.0, tileGridSize=(tile_grid_size, tile_grid_size))
-        yuv[:, :, 0] = clahe.apply(yuv[:, :, 0])
+        with self.clahe_pool.acquire(40.0, tile_grid_size) as clahe:
+            yuv[:, :, 0] = clahe.apply(yuv[:, :, 0])
         
         # Convert back to RGB
         enhanced = cv2.cvtColor(yuv, cv2.COLOR_YUV2RGB)
         
         return enhanced
     
-    def clahe_equalization(self, image_array, clip_limit=2.0, tile_grid_size=8):
+    def clahe_equalization(self, image_array, clip_limit=2.0, tile_grid_size=8, planes=None):
         """Apply Contrast Limited Adaptive Histogram Equalization (CLAHE)"""
         print(f"Applying CLAHE with clip limit {clip_limit} and tile size {tile_grid_size}...")
         
         # Convert to LAB color space for better results
-        lab = cv2.cvtColor(image_array, cv2.COLOR_RGB2LAB)
+        lab = planes.plane('lab').copy() if planes is not None else cv2.cvtColor(image_array, cv2.COLOR_RGB2LAB)
         
         # Apply CLAHE to L channel
-        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_grid_size, tile_grid_size))
-        lab[:, :, 0] = clahe.apply(lab[:, :, 0])
+        with self.clahe_pool.acquire(clip_limit, tile_grid_size) as clahe:
+            lab[:, :, 0] = clahe.apply(lab[:, :, 0])
         
         # Convert back to RGB
         enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
         
         return enhanced
     
-    def color_preserving_enhancement(self, image_array):
+    def color_preserving_enhancement(self, image_array, planes=None):
         """Apply color-preserving histogram equalization"""
         print("Applying color-preserving enhancement...")
         
         # Convert to HSV color space
-        hsv = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
+        hsv = planes.plane('hsv').copy() if planes is not None else cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
         
         # Apply histogram equalization to V (value/brightness) channel only
         hsv[:, :, 2] = cv2.equalizeHist(hsv[:, :, 2])
@@ -116,26 +256,48 @@ class HistogramEqualization:
         
         return enhanced
     
-    def multi_scale_retinex(self, image_array, scales=[15, 80, 250]):
-        """Apply Multi-Scale Retinex for advanced enhancement"""
-        print("Applying Multi-Scale Retinex...")
+    def retinex_surround(self, img, sigma):
+        """Gaussian surround for fast Retinex: large sigmas are blurred on a power-of-two
+        downsampled copy (at least RETINEX_MIN_SIGMA px there) and upsampled back"""
+        factor = 1 << max(0, int(np.log2(sigma / RETINEX_MIN_SIGMA)))
+        if factor == 1:
+            return cv2.GaussianBlur(img, (0, 0), sigma)
+        
+        h, w = img.shape[:2]
+        small = cv2.resize(img, (-(-w // factor), -(-h // factor)), interpolation=cv2.INTER_AREA)
+        
+        # Area downsampling and linear upsampling add roughly factor^2 / 4 of variance
+        small = cv2.GaussianBlur(small, (0, 0), np.sqrt(sigma ** 2 - factor ** 2 / 4) / factor)
+        
+        return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+    
+    def multi_scale_retinex(self, image_array, scales=[15, 80, 250], progress=None, mode='fast'):
+        """Apply Multi-Scale Retinex for advanced enhancement (mode: see RETINEX_MODES)"""
+        print(f"Applying Multi-Scale Retinex ({mode})...")
+        if mode not in RETINEX_MODES:
+            raise ValueError(f"Unknown retinex mode: {mode}")
         
         # Convert to float
-        img = image_array.astype(np.float64)
+        img = image_array.astype(np.float32 if mode == 'fast' else np.float64)
         
-        # Initialize retinex output
+        # Initialize retinex output; the log of the image is shared by every scale
         retinex = np.zeros_like(img)
+        log_img = np.log10(img + 1)
         
-        for scale in scales:
+        for i, scale in enumerate(scales):
             # Apply Gaussian blur
-            blurred = cv2.GaussianBlur(img, (0, 0), scale)
+            if mode == 'fast':
+                blurred = self.retinex_surround(img, scale)
+            else:
+                blurred = cv2.GaussianBlur(img, (0, 0), scale)
             
             # Avoid division by zero
             blurred[blurred == 0] = 1
             
             # Calculate single scale retinex
-            ssr = np.log10(img + 1) - np.log10(blurred + 1)
-            retinex += ssr
+            retinex += log_img - np.log10(blurred + 1)
+            if progress:
+                progress(0.7 * (i + 1) / len(scales))
         
         # Average the scales
         retinex = retinex / len(scales)
@@ -145,70 +307,77 @@ class HistogramEqualization:
         
         return retinex
     
-    def apply_enhancement(self, image_array, enhancement_type='global', clip_limit=2.0, tile_grid_size=8):
-        """Apply specified histogram enhancement"""
-        original_hist = self.calculate_histogram(image_array, 'gray')
-        
+    def enhance_image(self, image_array, enhancement_type='global', clip_limit=2.0, tile_grid_size=8,
+                      planes=None, progress=None, retinex_mode='fast'):
+        """Run the enhancement method selected by enhancement_type and return the enhanced image"""
         if enhancement_type == 'global':
-            enhanced = self.global_histogram_equalization(image_array)
+            return self.global_histogram_equalization(image_array)
         elif enhancement_type == 'adaptive':
-            enhanced = self.adaptive_histogram_equalization(image_array, tile_grid_size)
+            return self.adaptive_histogram_equalization(image_array, tile_grid_size, planes)
         elif enhancement_type == 'clahe':
-            enhanced = self.clahe_equalization(image_array, clip_limit, tile_grid_size)
+            return self.clahe_equalization(image_array, clip_limit, tile_grid_size, planes)
         elif enhancement_type == 'color_preserving':
-            enhanced = self.color_preserving_enhancement(image_array)
+            return self.color_preserving_enhancement(image_array, planes)
         elif enhancement_type == 'retinex':
-            enhanced = self.multi_scale_retinex(image_array)
+            return self.multi_scale_retinex(image_array, progress=progress, mode=retinex_mode)
         else:
             # Default to global
-            enhanced = self.global_histogram_equalization(image_array)
-        
-        enhanced_hist = self.calculate_histogram(enhanced, 'gray')
+            return self.global_histogram_equalization(image_array)
+    
+    def apply_enhancement(self, image_array, enhancement_type='global', clip_limit=2.0, tile_grid_size=8,
+                          planes=None, progress=None, histogram_format='image', return_planes=False,
+                          retinex_mode='fast'):
+        """Apply specified histogram enhancement (planes: optional ImagePlanes of image_array,
+        progress: optional callback taking the completed fraction, histogram_format: see HISTOGRAM_FORMATS,
+        retinex_mode: see RETINEX_MODES,
+        return_planes: also return the ImagePlanes of the enhanced image for calculate_enhancement_metrics)"""
+        if planes is None:
+            planes = ImagePlanes(image_array)
+        
+        enhanced = self.enhance_image(image_array, enhancement_type, clip_limit, tile_grid_size, planes, progress,
+                                      retinex_mode)
+        if progress:
+            progress(0.7)
+        
+        # The gray planes computed here are shared with the metrics step
+        enhanced_planes = ImagePlanes(enhanced)
         
         # Create histogram visualizations
-        original_hist_img = self.create_histogram_visualization(
-            original_hist, 'red', 'Original Histogram'
-        )
-        enhanced_hist_img = self.create_histogram_visualization(
-            enhanced_hist, 'green', 'Enhanced Histogram'
-        )
-        
-        histogram_data = {
-            'original': original_hist_img,
-            'enhanced': enhanced_hist_img,
-            'originalData': original_hist.tolist(),
-            'enhancedData': enhanced_hist.tolist()
-        }
+        histogram_data = self.histogram_payload(planes.histogram('gray'), enhanced_planes.histogram('gray'),
+                                                histogram_format)
+        if progress:
+            progress(0.8)
         
+        if return_planes:
+            return enhanced, histogram_data, enhanced_planes
         return enhanced, histogram_data
     
-    def calculate_enhancement_metrics(self, original, enhanced):
-        """Calculate enhancement quality metrics"""
-        # Convert to grayscale for metrics
-        original_gray = cv2.cvtColor(original, cv2.COLOR_RGB2GRAY)
-        enhanced_gray = cv2.cvtColor(enhanced, cv2.COLOR_RGB2GRAY)
+    def calculate_enhancement_metrics(self, original, enhanced, planes=None, enhanced_planes=None):
+        """Calculate enhancement quality metrics (planes, enhanced_planes: optional ImagePlanes of
+        the two images, whose gray planes and histograms are reused)"""
+        if planes is None:
+            planes = ImagePlanes(original)
+        if enhanced_planes is None:
+            enhanced_planes = ImagePlanes(enhanced)
+        
+        # Brightness, contrast and entropy all come from the gray histograms, which
+        # apply_enhancement has already computed for the response
+        original_brightness, original_contrast, original_entropy = \
+            self.histogram_statistics(planes.histogram('gray'))
+        enhanced_brightness, enhanced_contrast, enhanced_entropy = \
+            self.histogram_statistics(enhanced_planes.histogram('gray'))
         
         # Calculate contrast improvement
-        original_contrast = np.std(original_gray)
-        enhanced_contrast = np.std(enhanced_gray)
         contrast_improvement = (enhanced_contrast / original_contrast) * 100
         
-        # Calculate entropy (measure of information)
-        original_entropy = self.calculate_entropy(original_gray)
-        enhanced_entropy = self.calculate_entropy(enhanced_gray)
-        
-        # Calculate average brightness
-        original_brightness = np.mean(original_gray)
-        enhanced_brightness = np.mean(enhanced_gray)
-        
         metrics = {
-            'contrast_improvement': round(contrast_improvement, 2),
-            'original_entropy': round(original_entropy, 3),
-            'enhanced_entropy': round(enhanced_entropy, 3),
-            'original_brightness': round(original_brightness, 1),
-            'enhanced_brightness': round(enhanced_brightness, 1),
-            'original_contrast': round(original_contrast, 2),
-            'enhanced_contrast': round(enhanced_contrast, 2)
+            'contrast_improvement': round(float(contrast_improvement), 2),
+            'original_entropy': round(float(original_entropy), 3),
+            'enhanced_entropy': round(float(enhanced_entropy), 3),
+            'original_brightness': round(float(original_brightness), 1),
+            'enhanced_brightness': round(float(enhanced_brightness), 1),
+            'original_contrast': round(float(original_contrast), 2),
+            'enhanced_contrast': round(float(enhanced_contrast), 2)
         }
         
         return metrics
@@ -216,7 +385,21 @@ class HistogramEqualization:
     def calculate_entropy(self, image):
         """Calculate image entropy"""
         hist = cv2.calcHist([image], [0], None, [256], [0, 256])
-        hist = hist.flatten()
+        return self.histogram_entropy(hist.flatten())
+    
+    def histogram_statistics(self, hist):
+        """Mean, standard deviation and entropy of the pixels counted by a 256-bin histogram"""
+        counts = np.asarray(hist, dtype=np.float64)
+        total = counts.sum()
+        levels = np.arange(256, dtype=np.float64)
+        
+        mean = counts @ levels / total
+        std = np.sqrt(counts @ (levels - mean) ** 2 / total)
+        
+        return mean, std, self.histogram_entropy(counts)
+    
+    def histogram_entropy(self, hist):
+        """Entropy in bits of a 256-bin histogram"""
         hist = hist / np.sum(hist)  # Normalize
         
         # Remove zero entries
@@ -231,52 +414,44 @@ class HistogramEqualization:
         """Apply unsharp masking for additional enhancement"""
         print("Applying unsharp masking...")
         
-        # Create Gaussian blur
-        blurred = cv2.GaussianBlur(image_array, (0, 0), sigma)
-        
-        # Create unsharp mask
-        unsharp_mask = image_array.astype(np.float64) - blurred.astype(np.float64)
-        
-        # Apply the mask
-        enhanced = image_array.astype(np.float64) + strength * unsharp_mask
-        
-        # Clip values
-        enhanced = np.clip(enhanced, 0, 255).astype(np.uint8)
-        
-        return enhanced
+        # Blur, mask and sharpen in one saturating uint8 pass
+        return EnhancementPipeline().unsharp(sigma, strength).run(image_array)
     
-    def advanced_enhancement_pipeline(self, image_array, enhancement_type='clahe', **kwargs):
+    def advanced_enhancement_pipeline(self, image_array, enhancement_type='clahe', histogram_format='image',
+                                      planes=None, progress=None, return_planes=False, gamma=1.0, **kwargs):
         """Apply advanced enhancement pipeline"""
         print("Starting advanced enhancement pipeline...")
+        if planes is None:
+            planes = ImagePlanes(image_array)
         
-        # Step 1: Initial enhancement
-        enhanced, hist_data = self.apply_enhancement(image_array, enhancement_type, **kwargs)
+        # Step 1: Initial enhancement (histograms are taken once, after the final step);
+        # global equalization is a per-channel mapping, so it joins the LUT pass of step 3
+        pipeline = EnhancementPipeline()
+        if enhancement_type == 'global':
+            pipeline.equalize()
+        else:
+            pipeline.spatial(lambda image: self.enhance_image(image, enhancement_type, planes=planes,
+                                                              progress=progress, **kwargs))
         
         # Step 2: Optional unsharp masking for sharpness
         if enhancement_type in ['clahe', 'adaptive']:
-            enhanced = self.enhance_with_unsharp_masking(enhanced, sigma=1.0, strength=0.5)
+            pipeline.unsharp(sigma=1.0, strength=0.5)
         
         # Step 3: Final color correction
-        enhanced = self.apply_color_correction(enhanced)
+        pipeline.gamma(gamma)
+        enhanced = pipeline.run(image_array)
+        if progress:
+            progress(0.9)
         
         # Recalculate histograms after pipeline
-        final_hist = self.calculate_histogram(enhanced, 'gray')
-        hist_data['enhanced'] = self.create_histogram_visualization(
-            final_hist, 'green', 'Final Enhanced Histogram'
-        )
-        hist_data['enhancedData'] = final_hist.tolist()
+        enhanced_planes = ImagePlanes(enhanced)
+        hist_data = self.histogram_payload(planes.histogram('gray'), enhanced_planes.histogram('gray'),
+                                           histogram_format, 'Final Enhanced Histogram')
         
+        if return_planes:
+            return enhanced, hist_data, enhanced_planes
         return enhanced, hist_data
     
     def apply_color_correction(self, image_array, gamma=1.0):
         """Apply gamma correction for color balance"""
-        if gamma != 1.0:
-            # Build lookup table
-            inv_gamma = 1.0 / gamma
-            table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype(np.uint8)
-            
-            # Apply gamma correction
-            corrected = cv2.LUT(image_array, table)
-            return corrected
-        
-        return image_array
+        return EnhancementPipeline().gamma(gamma).run(image_array)
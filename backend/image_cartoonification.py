@@ -3,29 +3,48 @@ import numpy as np
 from PIL import Image, ImageFilter, ImageEnhance
 import io
 import base64
+from color_quantization import ColorQuantizer, PaletteCache
+from enhancement_pipeline import EnhancementPipeline
+
+# Longest side of the working copy used by preview renders
+DEFAULT_PREVIEW_SIZE = 512
+# Guided upsampling of previews: window radius in preview pixels and regularization
+# (intensities in [0, 1]); smaller eps follows the full-resolution edges more closely
+GUIDED_RADIUS = 2
+GUIDED_EPS = 1e-3
+# Upsampled previews with at most this many distinct colors are snapped back to them,
+# restoring the flat label regions and black edge lines
+PALETTE_SNAP_COLORS = 64
+# Styles that render faster at full resolution than a preview plus guided upsampling
+FULL_RESOLUTION_STYLES = ('sketch', 'pop_art')
 
 class ImageCartoonification:
     def __init__(self):
         """Initialize Image Cartoonification module"""
-        pass
+        # Palettes are fitted on a pixel subsample with a fixed seed, so styles are reproducible,
+        # and a base palette per (image, style, colors) is cached so parameter sweeps only refine it
+        self.palettes = PaletteCache()
+        self.quantizer = ColorQuantizer(palette_cache=self.palettes)
     
-    def classic_cartoon(self, image_array, intensity=5, color_levels=8):
+    def classic_cartoon(self, image_array, intensity=5, color_levels=8, progress=None, quantization=None,
+                        palette_key=None):
         """Apply classic cartoon effect"""
         # Step 1: Bilateral filter for smoothing
         bilateral = cv2.bilateralFilter(image_array, intensity*2, 80, 80)
+        if progress:
+            progress(0.3)
         
         # Step 2: Create edge mask
         gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
         gray_blur = cv2.medianBlur(gray, 5)
         edges = cv2.adaptiveThreshold(gray_blur, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 9)
+        if progress:
+            progress(0.4)
         
         # Step 3: Color quantization
-        data = np.float32(bilateral).reshape((-1, 3))
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-        _, labels, centers = cv2.kmeans(data, color_levels, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        centers = np.uint8(centers)
-        quantized_data = centers[labels.flatten()]
-        quantized_image = quantized_data.reshape(bilateral.shape)
+        quantized_image = self.quantizer.quantize(bilateral, color_levels, quantization, palette_key, image_array)
+        if progress:
+            progress(0.9)
         
         # Step 4: Combine with edges
         edges = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
@@ -33,7 +52,7 @@ class ImageCartoonification:
         
         return cartoon
     
-    def anime_style(self, image_array, intensity=5):
+    def anime_style(self, image_array, intensity=5, progress=None, quantization=None, palette_key=None):
         """Apply anime/manga style effect"""
         # Enhance saturation
         pil_image = Image.fromarray(image_array)
@@ -45,14 +64,11 @@ class ImageCartoonification:
         
         # Apply bilateral filter
         bilateral = cv2.bilateralFilter(enhanced_array, intensity*3, 100, 100)
+        if progress:
+            progress(0.4)
         
         # Create smooth color regions
-        data = np.float32(bilateral).reshape((-1, 3))
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-        _, labels, centers = cv2.kmeans(data, 6, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        centers = np.uint8(centers)
-        quantized_data = centers[labels.flatten()]
-        anime_image = quantized_data.reshape(bilateral.shape)
+        anime_image = self.quantizer.quantize(bilateral, 6, quantization, palette_key, enhanced_array)
         
         return anime_image
     
@@ -75,39 +91,39 @@ class ImageCartoonification:
         
         return sketch_rgb
     
-    def watercolor_effect(self, image_array, intensity=5):
+    def watercolor_effect(self, image_array, intensity=5, progress=None, quantization=None, palette_key=None):
         """Apply watercolor painting effect"""
         # Apply multiple bilateral filters for smoothing
         smooth = image_array.copy()
-        for _ in range(3):
+        for i in range(3):
             smooth = cv2.bilateralFilter(smooth, 9, 200, 200)
+            if progress:
+                progress(0.15 * (i + 1))
         
         # Reduce colors
-        data = np.float32(smooth).reshape((-1, 3))
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-        _, labels, centers = cv2.kmeans(data, 12, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        centers = np.uint8(centers)
-        quantized_data = centers[labels.flatten()]
-        watercolor = quantized_data.reshape(smooth.shape)
+        watercolor = self.quantizer.quantize(smooth, 12, quantization, palette_key)
+        if progress:
+            progress(0.9)
         
         # Add texture
-        texture_noise = np.random.randint(0, 25, watercolor.shape, dtype=np.uint8)
+        rng = np.random.default_rng(self.quantizer.seed)
+        texture_noise = rng.integers(0, 25, watercolor.shape, dtype=np.uint8)
         watercolor = cv2.add(watercolor, texture_noise)
         
         return watercolor
     
-    def comic_book_effect(self, image_array, color_levels=4):
+    def comic_book_effect(self, image_array, color_levels=4, progress=None, quantization=None,
+                          palette_key=None):
         """Apply comic book style"""
         # Strong bilateral filter
         bilateral = cv2.bilateralFilter(image_array, 15, 100, 100)
+        if progress:
+            progress(0.4)
         
         # Aggressive color quantization
-        data = np.float32(bilateral).reshape((-1, 3))
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-        _, labels, centers = cv2.kmeans(data, color_levels, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        centers = np.uint8(centers)
-        quantized_data = centers[labels.flatten()]
-        quantized = quantized_data.reshape(bilateral.shape)
+        quantized = self.quantizer.quantize(bilateral, color_levels, quantization, palette_key, image_array)
+        if progress:
+            progress(0.9)
         
         # Create strong edges
         gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
@@ -128,14 +144,8 @@ class ImageCartoonification:
     
     def pop_art_effect(self, image_array):
         """Apply pop art style"""
-        # High contrast
-        pil_image = Image.fromarray(image_array)
-        enhancer = ImageEnhance.Contrast(pil_image)
-        high_contrast = enhancer.enhance(2.0)
-        
-        # Convert back and posterize
-        posterized = np.array(high_contrast)
-        posterized = (posterized // 64) * 64
+        # High contrast and posterize, composed into one LUT pass
+        posterized = EnhancementPipeline().contrast(2.0).posterize(4).run(image_array)
         
         # Boost saturation
         pil_posterized = Image.fromarray(posterized)
@@ -144,27 +154,95 @@ class ImageCartoonification:
         
         return np.array(pop_art)
     
-    def apply_cartoon_effect(self, image_array, style='classic', intensity=5, color_levels=8):
-        """Apply specified cartoon effect"""
+    def apply_cartoon_effect(self, image_array, style='classic', intensity=5, color_levels=8, progress=None,
+                             quantization=None, image_key=None, preview=False, max_preview_size=DEFAULT_PREVIEW_SIZE,
+                             preview_upscale=False):
+        """Apply specified cartoon effect, reporting stage progress to an optional progress(fraction)
+        (quantization: palette strategy from QUANTIZATION_STRATEGIES, default k-means; image_key:
+        optional image hash under which the fitted palette is cached for later calls; preview: see
+        preview_cartoon_effect)"""
+        if preview:
+            return self.preview_cartoon_effect(image_array, style, intensity, color_levels, progress, quantization,
+                                               image_key, max_preview_size, preview_upscale)
+        
         print(f"Applying {style} cartoon effect...")
+        palette_key = (image_key, style) if image_key is not None else None
         
         if style == 'classic':
-            return self.classic_cartoon(image_array, intensity, color_levels)
+            return self.classic_cartoon(image_array, intensity, color_levels, progress, quantization, palette_key)
         elif style == 'anime':
-            return self.anime_style(image_array, intensity)
+            return self.anime_style(image_array, intensity, progress, quantization, palette_key)
         elif style == 'sketch':
             return self.sketch_effect(image_array)
         elif style == 'watercolor':
-            return self.watercolor_effect(image_array, intensity)
+            return self.watercolor_effect(image_array, intensity, progress, quantization, palette_key)
         elif style == 'comic':
-            return self.comic_book_effect(image_array, color_levels)
+            return self.comic_book_effect(image_array, color_levels, progress, quantization, palette_key)
         elif style == 'oil_painting':
             try:
                 return self.oil_painting_effect(image_array, intensity)
             except:
                 # Fallback if xphoto not available
-                return self.classic_cartoon(image_array, intensity, color_levels)
+                return self.classic_cartoon(image_array, intensity, color_levels, progress, quantization, palette_key)
         elif style == 'pop_art':
             return self.pop_art_effect(image_array)
         else:
-            return self.classic_cartoon(image_array, intensity, color_levels)
+            return self.classic_cartoon(image_array, intensity, color_levels, progress, quantization, palette_key)
+    
+    def preview_cartoon_effect(self, image_array, style='classic', intensity=5, color_levels=8, progress=None,
+                               quantization=None, image_key=None, max_size=DEFAULT_PREVIEW_SIZE, upscale=False):
+        """Render the effect on a copy downscaled to max_size on its longest side; returns the
+        small result, or with upscale, one guided back to full resolution"""
+        if max_size < 1:
+            raise ValueError(f"maxPreviewSize must be positive, got {max_size}")
+        h, w = image_array.shape[:2]
+        scale = max_size / max(h, w)
+        if scale >= 1 or (upscale and style in FULL_RESOLUTION_STYLES):
+            return self.apply_cartoon_effect(image_array, style, intensity, color_levels, progress, quantization,
+                                             image_key)
+        
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small = cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+        print(f"Preview at {size[0]}x{size[1]} (source {w}x{h})")
+        
+        # Preview palettes are fitted on the downscaled pixels, so they are cached apart from
+        # full-resolution ones; otherwise a render would depend on which came first
+        preview_key = (image_key, 'preview', size) if image_key is not None else None
+        cartoon = self.apply_cartoon_effect(small, style, intensity, color_levels, progress, quantization,
+                                            preview_key)
+        if not upscale:
+            return cartoon
+        
+        return self.guided_upsample(cartoon, small, image_array)
+    
+    def guided_upsample(self, result, small_source, source):
+        """Upsample a low-resolution result with a fast guided filter whose guide is the
+        full-resolution source, then snap few-color results back to their own palette"""
+        h, w = source.shape[:2]
+        size = (2 * GUIDED_RADIUS + 1, 2 * GUIDED_RADIUS + 1)
+        
+        # Linear model result ~ a * guide + b, fitted per window at low resolution
+        guide = np.float32(cv2.cvtColor(small_source, cv2.COLOR_RGB2GRAY)) / 255
+        target = np.float32(result) / 255
+        mean_guide = cv2.boxFilter(guide, -1, size)[:, :, None]
+        var_guide = cv2.boxFilter(guide * guide, -1, size)[:, :, None] - mean_guide ** 2
+        mean_target = cv2.boxFilter(target, -1, size)
+        covariance = cv2.boxFilter(target * guide[:, :, None], -1, size) - mean_guide * mean_target
+        a = covariance / (var_guide + GUIDED_EPS)
+        b = mean_target - a * mean_guide
+        
+        # Smooth and upsample the coefficients, then apply them to the full-resolution guide
+        a = cv2.resize(cv2.boxFilter(a, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        b = cv2.resize(cv2.boxFilter(b, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        full_guide = np.float32(cv2.cvtColor(source, cv2.COLOR_RGB2GRAY)) / 255
+        upsampled = np.clip((a * full_guide[:, :, None] + b) * 255, 0, 255)
+        
+        # Labels and edge mask: nearest color of the preview's palette (black edges included)
+        pixels = result.reshape(-1, 3).astype(np.int32)
+        packed = np.unique((pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2])
+        if len(packed) <= PALETTE_SNAP_COLORS:
+            colors = np.stack([packed >> 16, (packed >> 8) & 255, packed & 255], axis=1).astype(np.uint8)
+            labels = self.quantizer.assign(upsampled.reshape(-1, 3), colors)
+            return colors[labels].reshape(h, w, 3)
+        
+        return np.uint8(np.rint(upsampled))
@@ -0,0 +1,56 @@
+import cv2
+import threading
+
+# Color space conversions available as derived planes of an RGB image
+PLANE_CONVERSIONS = {
+    'gray': cv2.COLOR_RGB2GRAY,
+    'lab': cv2.COLOR_RGB2LAB,
+    'yuv': cv2.COLOR_RGB2YUV,
+    'hsv': cv2.COLOR_RGB2HSV
+}
+
+class ImagePlanes:
+    def __init__(self, image, on_grow=None):
+        """Wrap a decoded RGB image whose derived planes are computed on first use
+        (on_grow: optional callback run after a plane or histogram is added, outside the lock)"""
+        self.image = image
+        self.on_grow = on_grow
+        self._planes = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def plane(self, name):
+        """Color-converted copy of the image (read-only; copy before modifying)"""
+        with self._lock:
+            plane = self._planes.get(name)
+            grew = plane is None
+            if grew:
+                plane = cv2.cvtColor(self.image, PLANE_CONVERSIONS[name])
+                plane.setflags(write=False)
+                self._planes[name] = plane
+        if grew and self.on_grow is not None:
+            self.on_grow()
+        return plane
+
+    def histogram(self, channel='gray'):
+        """256-bin histogram of the gray plane or of the 'r', 'g' or 'b' channel"""
+        with self._lock:
+            histogram = self._histograms.get(channel)
+        if histogram is None:
+            if channel == 'gray':
+                source, index = self.plane('gray'), 0
+            else:
+                source, index = self.image, 'rgb'.index(channel)
+            histogram = cv2.calcHist([source], [index], None, [256], [0, 256]).flatten()
+            histogram.setflags(write=False)
+            with self._lock:
+                self._histograms[channel] = histogram
+            if self.on_grow is not None:
+                self.on_grow()
+        return histogram
+
+    def nbytes(self):
+        """Memory held by the image and its derived planes"""
+        with self._lock:
+            return self.image.nbytes + sum(p.nbytes for p in self._planes.values()) + \
+                sum(h.nbytes for h in self._histograms.values())
@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from image_planes import ImagePlanes
+
+class ImageNotFoundError(Exception):
+    """Raised when an image handle is unknown or has expired"""
+
+class StoredImage:
+    def __init__(self, image, image_bytes):
+        """Decoded upload with its encoded size and lazily derived planes"""
+        image.setflags(write=False)
+        self.image = image
+        self.image_bytes = image_bytes
+        self.planes = ImagePlanes(image)
+        self.digest = None
+
+class ImageStore:
+    def __init__(self, ttl=600, max_bytes=512 * 1024 * 1024):
+        """Initialize a TTL/LRU store of decoded uploads addressed by image handles"""
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, stored):
+        """Register a StoredImage and return its handle"""
+        image_id = uuid.uuid4().hex
+        # Planes derived by later requests count against the budget as they are created
+        stored.planes.on_grow = self.trim
+        with self._lock:
+            self._entries[image_id] = (stored, time.monotonic())
+            self._evict()
+        return image_id
+
+    def get(self, image_id):
+        """Return the StoredImage for a handle, refreshing its expiry"""
+        with self._lock:
+            entry = self._entries.get(image_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self._entries.pop(image_id, None)
+                raise ImageNotFoundError(f"Unknown or expired imageId: {image_id}")
+            self._entries[image_id] = (entry[0], time.monotonic())
+            self._entries.move_to_end(image_id)
+            return entry[0]
+
+    def discard(self, image_id):
+        """Drop a handle; returns whether it existed"""
+        with self._lock:
+            return self._entries.pop(image_id, None) is not None
+
+    def stats(self):
+        """Entry count and memory held by stored images and their planes"""
+        with self._lock:
+            entries = [stored for stored, _ in self._entries.values()]
+        return {
+            'entries': len(entries),
+            'bytes': sum(stored.planes.nbytes() + len(stored.image_bytes) for stored in entries),
+            'maxBytes': self.max_bytes,
+            'ttl': self.ttl
+        }
+
+    def trim(self):
+        """Re-apply the TTL and memory budget, e.g. after a stored image gained planes"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until within budget"""
+        now = time.monotonic()
+        for image_id in [key for key, (_, touched) in self._entries.items() if now - touched > self.ttl]:
+            del self._entries[image_id]
+
+        total = sum(stored.planes.nbytes() + len(stored.image_bytes) for stored, _ in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, (stored, _) = self._entries.popitem(last=False)
+            total -= stored.planes.nbytes() + len(stored.image_bytes)
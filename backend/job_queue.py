@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Default JOB_WORKERS; 0 disables async jobs
+DEFAULT_JOB_WORKERS = 2
+# Finished jobs kept per pending slot by default; each holds its full encoded result
+FINISHED_JOBS_PER_SLOT = 4
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class JobNotFoundError(Exception):
+    """Raised when a job id is unknown or its result has been discarded"""
+
+class JobCancelledError(Exception):
+    """Raised inside a running job at its next progress report after cancellation"""
+
+class Job:
+    def __init__(self, operation):
+        """Track the state, progress and result of one queued operation"""
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self._future = None
+        self._cancelled = threading.Event()
+        self._changed = threading.Condition()
+
+    def report(self, fraction):
+        """Progress callback for the processing modules; raises once the job is cancelled"""
+        if self._cancelled.is_set():
+            raise JobCancelledError(f"Job {self.id} cancelled")
+        fraction = min(max(float(fraction), 0.0), 1.0)
+        if fraction - self.progress >= 0.01 or fraction == 1.0:
+            self._update(progress=fraction)
+
+    def wait(self, version, timeout):
+        """Block until the job changes past version or the timeout expires; returns the new version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_dict(self):
+        """Status summary for the polling and event endpoints"""
+        now = self.finished or time.time()
+        status = {
+            'jobId': self.id,
+            'operation': self.operation,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'elapsed': round(now - (self.started or now), 3)
+        }
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+    def _update(self, **fields):
+        with self._changed:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.version += 1
+            self._changed.notify_all()
+
+class JobQueue:
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, max_pending=16, retention=600, max_finished=None):
+        """Initialize a bounded worker pool for long-running operations (max_finished: finished
+        jobs kept for their results, default FINISHED_JOBS_PER_SLOT * max_pending)"""
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.retention = retention
+        self.max_finished = max(1, int(max_finished or FINISHED_JOBS_PER_SLOT * self.max_pending))
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+
+    def submit(self, operation, task):
+        """Queue task(job) and return the Job; raises QueueFullError when at capacity"""
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending)")
+            self._pending += 1
+            job = Job(operation)
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(self._run, job, task)
+        return job
+
+    def get(self, job_id):
+        """Return the Job for an id"""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(f"Unknown or expired jobId: {job_id}")
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued job immediately, or a running one at its next progress report"""
+        job = self.get(job_id)
+        if job.status in FINISHED_STATES:
+            return job
+        job._cancelled.set()
+        if job._future.cancel():
+            # Never started, so _run will not release its slot
+            self._finish(job, status=JOB_CANCELLED)
+        return job
+
+    def stats(self):
+        """Queue occupancy and job counts by status"""
+        with self._lock:
+            self._prune()
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'maxPending': self.max_pending,
+                'maxFinished': self.max_finished,
+                'jobs': counts
+            }
+
+    def _run(self, job, task):
+        if job._cancelled.is_set():
+            self._finish(job, status=JOB_CANCELLED)
+            return
+        job._update(status=JOB_RUNNING, started=time.time())
+        try:
+            result = task(job)
+        except JobCancelledError:
+            self._finish(job, status=JOB_CANCELLED)
+        except Exception as e:
+            print(f"Job {job.id} ({job.operation}) error: {str(e)}")
+            self._finish(job, status=JOB_FAILED, error=str(e))
+        else:
+            self._finish(job, status=JOB_DONE, result=result, progress=1.0)
+
+    def _finish(self, job, **fields):
+        with self._lock:
+            if job.finished is not None:
+                return
+            job.finished = time.time()
+            self._pending -= 1
+            self._prune()
+        job._update(**fields)
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period, then the oldest finished ones
+        beyond max_finished (lock held)"""
+        cutoff = time.time() - self.retention
+        finished = sorted((job.finished, key) for key, job in self._jobs.items() if job.finished)
+        expired = sum(1 for when, _ in finished if when < cutoff)
+        excess = len(finished) - self.max_finished
+        for _, job_id in finished[:max(expired, excess)]:
+            del self._jobs[job_id]
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Fraction of disk_max_bytes the disk tier is trimmed down to once it exceeds the budget,
+# so the directory is scanned once per batch of writes rather than on every put
+DISK_TRIM_TARGET = 0.9
+
+class ResultCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=2 * 1024 * 1024 * 1024):
+        """Initialize a size-bounded LRU of encoded responses with an optional on-disk tier"""
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'diskHits': 0, 'misses': 0, 'evictions': 0}
+        # Running size of the disk tier, seeded by one scan and resynced whenever it is trimmed
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def image_digest(self, image_array):
+        """Content hash of decoded pixels (shape and dtype included)"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{image_array.shape}|{image_array.dtype}".encode())
+        digest.update(memoryview(image_array).cast('B') if image_array.flags.c_contiguous
+                      else image_array.tobytes())
+        return digest.hexdigest()
+
+    def make_key(self, operation, image_digest, params):
+        """Cache key for an operation on an image with normalized parameters"""
+        return hashlib.blake2b(
+            json.dumps([operation, image_digest, params], sort_keys=True).encode(), digest_size=20
+        ).hexdigest()
+
+    def get(self, key):
+        """Return the cached (body, mimetype, headers) entry for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['diskHits'] += 1
+        self._put_memory(key, entry)
+        return entry
+
+    def put(self, key, body, mimetype, headers=None):
+        """Store an encoded response body with its mimetype and extra headers"""
+        entry = (bytes(body), mimetype, dict(headers or {}))
+        self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self):
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['maxBytes'] = self.max_bytes
+        stats['diskEnabled'] = bool(self.disk_dir)
+        if self.disk_dir:
+            with self._disk_lock:
+                stats['diskBytes'] = self._disk_bytes
+        return stats
+
+    def _entry_size(self, entry):
+        body, mimetype, headers = entry
+        return len(body) + sum(len(k) + len(v) for k, v in headers.items())
+
+    def _put_memory(self, key, entry):
+        size = self._entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._entry_size(previous)
+            self._entries[key] = entry
+            self._bytes += size
+
+            # Evict least recently used entries until within budget
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(evicted)
+                self._counters['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return body, header['mimetype'], header['headers']
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        body, mimetype, headers = entry
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(json.dumps({'mimetype': mimetype, 'headers': headers}).encode() + b'\n')
+                f.write(body)
+                size = f.tell()
+            with self._disk_lock:
+                try:
+                    replaced = os.stat(path).st_size
+                except OSError:
+                    replaced = 0
+                os.replace(temp_path, path)
+                self._disk_bytes += size - replaced
+                over_budget = self._disk_bytes > self.disk_max_bytes
+            if over_budget:
+                self._trim_disk()
+        except OSError as e:
+            print(f"Result cache disk write failed: {str(e)}")
+
+    def _disk_files(self):
+        """(mtime, size, path) of every cache file in the disk tier"""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.bin'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _trim_disk(self):
+        """Delete the oldest cache files until the disk tier is back under DISK_TRIM_TARGET of
+        its budget; the running total is replaced by the scanned one"""
+        with self._disk_lock:
+            if self._disk_bytes <= self.disk_max_bytes:
+                # Another writer trimmed while this one waited for the lock
+                return
+            files = self._disk_files()
+            total = sum(size for _, size, _ in files)
+            target = self.disk_max_bytes * DISK_TRIM_TARGET
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._disk_bytes = total
@@ -0,0 +1,175 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from job_queue import DEFAULT_JOB_WORKERS
+
+# Thread pools sized by these variables are created when numpy/OpenCV load,
+# so they must be set before the app module is imported in each worker
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# Rows shown by --import-report
+IMPORT_REPORT_ROWS = 20
+
+def parse_args():
+    """Command-line options for the production server"""
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Serve the DIP Suite API with a worker pool')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 1)),
+                        help='worker processes (default: 1; image handles live in one worker, see README)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 2 * cpus)),
+                        help='request threads per worker (default: 2 x CPU count)')
+    parser.add_argument('--cv-threads', type=int, default=None,
+                        help='OpenCV/BLAS/DCT threads per worker (default: CPUs / workers)')
+    parser.add_argument('--timeout', type=int, default=120, help='worker request timeout in seconds')
+    parser.add_argument('--no-warmup', action='store_true', help='skip the per-worker warm-up run')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'), default=None,
+                        help='server backend (default: gunicorn when installed)')
+    parser.add_argument('--import-report', action='store_true',
+                        help='print an import-time breakdown of the app in a fresh interpreter and exit')
+    return parser.parse_args()
+
+def configure_threads(cv_threads):
+    """Limit native thread pools of the current process before the app is imported"""
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(cv_threads))
+    os.environ.setdefault('DCT_WORKERS', str(cv_threads))
+
+def configure_worker(cv_threads):
+    """Per-worker OpenCV settings, applied after fork"""
+    import cv2
+    cv2.setNumThreads(cv_threads)
+
+def warm_up():
+    """Run each pipeline once on a synthetic image so the first request skips lazy initialization"""
+    import numpy as np
+    import app as api
+    from image_store import StoredImage
+
+    start = time.perf_counter()
+    y, x = np.mgrid[0:64, 0:64]
+    rng = np.random.default_rng(0)
+    synthetic = np.stack([x, y, (x + y) // 2], axis=-1) * 4 + rng.integers(0, 32, (64, 64, 3))
+    synthetic = np.clip(synthetic, 0, 255).astype(np.uint8)
+    source = StoredImage(synthetic, api.encode_image_to_bytes(synthetic))
+
+    # Compression: basis/quantization caches, entropy coder and both color paths
+    for color_mode in ('rgb', 'ycbcr'):
+        api.process_compress(source, {'colorMode': color_mode})
+    api.compressor.rate_distortion_curve(synthetic, (25, 75))
+
+    for style in ('classic', 'anime', 'sketch', 'watercolor', 'comic', 'oil_painting', 'pop_art'):
+        api.process_cartoonify(source, {'style': style})
+    for enhancement_type in ('global', 'adaptive', 'clahe', 'color_preserving', 'retinex'):
+        api.process_histogram_equalize(source, {'type': enhancement_type})
+    enhanced, _ = api.process_advanced_enhance(source, {})
+    api.encode_image_to_base64(enhanced)
+
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s (pid {os.getpid()})")
+
+def import_report(module='app', rows=IMPORT_REPORT_ROWS):
+    """Import the app in a fresh interpreter under -X importtime and print the slowest imports"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=backend_dir, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit(result.returncode)
+
+    # Lines look like "import time:  self [us] | cumulative | <indent>package"
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(cumulative_us), int(self_us), depth, name.strip()))
+
+    total = next(cumulative for cumulative, _, _, name in entries if name == module)
+    print(f"Import of '{module}': {total / 1000:.1f} ms cumulative, {wall * 1000:.0f} ms process wall time")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, self_us, depth, name in sorted(entries, reverse=True)[:rows]:
+        print(f"{cumulative / 1000:14.1f} {self_us / 1000:9.1f}  {'  ' * depth}{name}")
+
+def run_gunicorn(options):
+    """Pre-fork gunicorn server with threaded workers"""
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        configure_worker(options.cv_threads)
+
+    def post_worker_init(worker):
+        if not options.no_warmup:
+            warm_up()
+
+    class DIPApplication(BaseApplication):
+        def load_config(self):
+            config = {
+                'bind': f"{options.host}:{options.port}",
+                'workers': options.workers,
+                'threads': options.threads,
+                'worker_class': 'gthread',
+                'timeout': options.timeout,
+                'post_fork': post_fork,
+                'post_worker_init': post_worker_init
+            }
+            for key, value in config.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    DIPApplication().run()
+
+def run_werkzeug(options):
+    """Single-process threaded fallback where gunicorn is unavailable (e.g. Windows)"""
+    configure_worker(options.cv_threads)
+    if not options.no_warmup:
+        warm_up()
+    from app import app
+    app.run(host=options.host, port=options.port, threaded=True, debug=False)
+
+if __name__ == '__main__':
+    options = parse_args()
+    if options.import_report:
+        import_report()
+        raise SystemExit(0)
+
+    server = options.server
+    if server is None:
+        try:
+            import gunicorn
+            server = 'gunicorn'
+        except ImportError:
+            server = 'werkzeug'
+    if options.cv_threads is None:
+        # Split the cores between worker processes so their native thread pools don't oversubscribe
+        workers = options.workers if server == 'gunicorn' else 1
+        options.cv_threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+
+    if server == 'gunicorn' and options.workers > 1:
+        # Job status, results and events are only known to the worker that ran the job
+        if int(os.environ.get('JOB_WORKERS', DEFAULT_JOB_WORKERS)) > 0:
+            raise SystemExit(f"--workers {options.workers}: async jobs keep their state in one worker, so "
+                             f"polls landing on another worker would get 404. Use one worker, or set "
+                             f"JOB_WORKERS=0 to disable /jobs.")
+        # gunicorn spreads requests over its workers, so a handle from /upload on one
+        # worker is unknown to the others
+        print(f"⚠️  {options.workers} workers: image handles from /upload are held by the worker that "
+              f"created them and other workers answer 404. Prefer one worker per instance with sticky "
+              f"routing between instances (see README).")
+
+    configure_threads(options.cv_threads)
+    if server == 'gunicorn':
+        print(f"🚀 Serving DIP Suite API with gunicorn: workers={options.workers}, "
+              f"threads={options.threads}, cv_threads={options.cv_threads}")
+        run_gunicorn(options)
+    else:
+        print(f"🚀 Serving DIP Suite API with werkzeug: cv_threads={options.cv_threads}")
+        run_werkzeug(options)
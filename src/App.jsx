@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useState, useEffect } from 'react';
 import Header from './components/Header';
 import UploadZone from './components/UploadZone';
 import ControlsPanel from './components/ControlsPanel';
@@ -14,6 +14,7 @@ import {
   calculatePSNR, 
   calculateMSE 
 } from './utils/compressionAlgorithms';
+import { postImage, releaseImage } from './utils/apiClient';
 
 function App() {
   // Core states
@@ -28,6 +29,9 @@ function App() {
   const [blockSize, setBlockSize] = useState(8);
   const [stats, setStats] = useState(null);
   
+  // Release the previous compressed image blob whenever it is replaced or cleared
+  useEffect(() => () => releaseImage(compressedImage?.src), [compressedImage]);
+  
   // Cartoon states
   const [cartoonResult, setCartoonResult] = useState(null);
   
@@ -125,20 +129,11 @@ function App() {
     const startTime = performance.now();
     
     try {
-      const response = await fetch('http://localhost:5000/compress', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          image: image.src,
-          quality: quality,
-          blockSize: blockSize
-        })
+      const result = await postImage('/compress', image.src, {
+        quality: quality,
+        blockSize: blockSize
       });
       
-      const result = await response.json();
-      
       if (result.success) {
         const compressedImg = new Image();
         compressedImg.onload = () => {
@@ -151,10 +146,10 @@ function App() {
           
           setCompressedImageData(compImageData);
         };
-        compressedImg.src = result.compressedImage;
+        compressedImg.src = result.image;
         
         setCompressedImage({
-          src: result.compressedImage,
+          src: result.image,
           size: result.metrics.compressedSize
         });
         
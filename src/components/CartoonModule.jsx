@@ -1,4 +1,8 @@
 import { useState, useRef } from 'react';
+import { postImage, releaseImage } from '../utils/apiClient';
+
+// Longest side, in pixels, of API preview renders
+const PREVIEW_SIZE = 512;
 
 function CartoonModule({ originalImage, onCartoonCreated, useAPI = false }) {
   const [cartoonStyle, setCartoonStyle] = useState('anime');  // Changed default from 'classic' to 'anime'
@@ -6,6 +10,13 @@ function CartoonModule({ originalImage, onCartoonCreated, useAPI = false }) {
   const [colorLevels, setColorLevels] = useState(8);
   const [processing, setProcessing] = useState(false);
   const [cartoonResult, setCartoonResult] = useState(null);
+
+  // Replace the shown result, releasing the previous one's image blob
+  const showResult = (result) => {
+    releaseImage(cartoonResult?.src);
+    setCartoonResult(result);
+    onCartoonCreated(result);
+  };
   const canvasRef = useRef(null);
 
   const cartoonStyles = {
@@ -66,8 +77,7 @@ function CartoonModule({ originalImage, onCartoonCreated, useAPI = false }) {
           method: 'JavaScript'
         };
 
-        setCartoonResult(result);
-        onCartoonCreated(result);
+        showResult(result);
         setProcessing(false);
       };
 
@@ -318,39 +328,31 @@ function CartoonModule({ originalImage, onCartoonCreated, useAPI = false }) {
     return [Math.round(r * 255), Math.round(g * 255), Math.round(b * 255)];
   };
 
-  // Python API cartoon generation
-  const applyCartoonAPI = async () => {
+  // Python API cartoon generation; previews render on a downscaled copy for fast feedback
+  const applyCartoonAPI = async (preview = false) => {
     if (!originalImage) return;
 
     setProcessing(true);
 
     try {
-      const response = await fetch('http://localhost:5000/cartoonify', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          image: originalImage.src,
-          style: cartoonStyle,
-          intensity: intensity,
-          colorLevels: colorLevels
-        })
+      const result = await postImage('/cartoonify', originalImage.src, {
+        style: cartoonStyle,
+        intensity: intensity,
+        colorLevels: colorLevels,
+        preview: preview,
+        maxPreviewSize: PREVIEW_SIZE
       });
 
-      const result = await response.json();
-
       if (result.success) {
         const cartoonResult = {
-          src: result.cartoonImage,
+          src: result.image,
           style: result.style,
           intensity: result.intensity,
           colorLevels: result.colorLevels,
-          method: 'Python API (Advanced)'
+          method: result.preview ? 'Python API (Preview)' : 'Python API (Advanced)'
         };
 
-        setCartoonResult(cartoonResult);
-        onCartoonCreated(cartoonResult);
+        showResult(cartoonResult);
       } else {
         console.error('Cartoonification failed:', result.error);
         alert(`Cartoonification failed: ${result.error}`);
@@ -464,6 +466,19 @@ function CartoonModule({ originalImage, onCartoonCreated, useAPI = false }) {
             )}
           </button>
 
+          {useAPI && (
+            <button
+              onClick={() => applyCartoonAPI(true)}
+              disabled={processing}
+              className="px-8 py-6 bg-gradient-to-r from-violet-500 to-fuchsia-500 text-white rounded-2xl font-black text-xl shadow-2xl hover:shadow-fuchsia-500/60 hover:scale-105 transition-all duration-300 disabled:opacity-50"
+            >
+              <span className="flex items-center gap-3">
+                <span className="text-2xl">⚡</span>
+                Quick Preview
+              </span>
+            </button>
+          )}
+
           {cartoonResult && (
             <button
               onClick={downloadCartoon}
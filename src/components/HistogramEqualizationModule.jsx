@@ -1,4 +1,5 @@
 import { useState, useRef } from 'react';
+import { postImage, releaseImage } from '../utils/apiClient';
 
 function HistogramEqualizationModule({ originalImage, onEnhancementCreated, useAPI = false }) {
   const [enhancementType, setEnhancementType] = useState('global');
@@ -9,6 +10,14 @@ function HistogramEqualizationModule({ originalImage, onEnhancementCreated, useA
   const [histograms, setHistograms] = useState(null);
   const canvasRef = useRef(null);
 
+  // Replace the shown result, releasing the previous one's image blob
+  const showResult = (result) => {
+    releaseImage(enhancementResult?.src);
+    setEnhancementResult(result);
+    setHistograms(result.histograms);
+    onEnhancementCreated(result);
+  };
+
   const enhancementTypes = {
     global: 'Global Histogram Equalization',
     adaptive: 'Adaptive Histogram Equalization (AHE)',
@@ -305,9 +314,7 @@ function HistogramEqualizationModule({ originalImage, onEnhancementCreated, useA
           histograms: histogramData
         };
 
-        setEnhancementResult(result);
-        setHistograms(histogramData);
-        onEnhancementCreated(result);
+        showResult(result);
         setProcessing(false);
       };
 
@@ -322,35 +329,33 @@ function HistogramEqualizationModule({ originalImage, onEnhancementCreated, useA
     setProcessing(true);
 
     try {
-      const response = await fetch('http://localhost:5000/histogram_equalize', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          image: originalImage.src,
-          type: enhancementType,
-          clipLimit: clipLimit,
-          tileGridSize: tileGridSize
-        })
+      const result = await postImage('/histogram_equalize', originalImage.src, {
+        type: enhancementType,
+        clipLimit: clipLimit,
+        tileGridSize: tileGridSize,
+        histogramFormat: 'data'
       });
 
-      const result = await response.json();
-
       if (result.success) {
+        // Binary responses carry only the histogram data; draw the plots locally
+        const histogramData = {
+          original: createHistogramImage(result.histograms.originalData, '#EF4444'),
+          enhanced: createHistogramImage(result.histograms.enhancedData, '#10B981'),
+          originalData: result.histograms.originalData,
+          enhancedData: result.histograms.enhancedData
+        };
+
         const enhancementResult = {
-          src: result.enhancedImage,
+          src: result.image,
           type: result.type,
           clipLimit: result.clipLimit,
           tileGridSize: result.tileGridSize,
           method: 'Python API (Advanced)',
-          histograms: result.histograms,
+          histograms: histogramData,
           metrics: result.metrics
         };
 
-        setEnhancementResult(enhancementResult);
-        setHistograms(result.histograms);
-        onEnhancementCreated(enhancementResult);
+        showResult(enhancementResult);
       } else {
         console.error('Enhancement failed:', result.error);
         alert(`Enhancement failed: ${result.error}`);
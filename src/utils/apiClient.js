@@ -0,0 +1,85 @@
+export const API_BASE_URL = 'http://localhost:5000';
+
+// Response header in which the Python API returns metadata for binary responses
+const METADATA_HEADER = 'X-Result-Metadata';
+
+// Server-side image handles, keyed by image source, so parameter changes skip re-upload
+const imageHandles = new Map();
+const MAX_IMAGE_HANDLES = 16;
+
+export async function toBlob(source) {
+  const response = await fetch(source);
+  return response.blob();
+}
+
+// Upload an image once; the server keeps the decoded pixels and returns a handle.
+export function uploadImage(imageSrc) {
+  if (!imageHandles.has(imageSrc)) {
+    const upload = (async () => {
+      const form = new FormData();
+      form.append('image', await toBlob(imageSrc), 'image');
+      const response = await fetch(`${API_BASE_URL}/upload`, { method: 'POST', body: form });
+      const result = await response.json();
+      if (!result.success) {
+        throw new Error(result.error || 'Upload failed');
+      }
+      return result.imageId;
+    })();
+    upload.catch(() => imageHandles.delete(imageSrc));
+    imageHandles.set(imageSrc, upload);
+    if (imageHandles.size > MAX_IMAGE_HANDLES) {
+      imageHandles.delete(imageHandles.keys().next().value);
+    }
+  }
+  return imageHandles.get(imageSrc);
+}
+
+async function postWithHandle(endpoint, imageSrc, params) {
+  const form = new FormData();
+  form.append('imageId', await uploadImage(imageSrc));
+  Object.entries(params).forEach(([key, value]) => {
+    form.append(key, String(value));
+  });
+
+  return fetch(`${API_BASE_URL}${endpoint}`, {
+    method: 'POST',
+    body: form
+  });
+}
+
+// Free the blob behind an image URL returned by postImage once the result is replaced
+export function releaseImage(src) {
+  if (src && src.startsWith('blob:')) {
+    URL.revokeObjectURL(src);
+  }
+}
+
+// Process an uploaded image by handle and receive the processed image as binary.
+// Resolves to the endpoint's metadata plus an object URL for the returned image.
+export async function postImage(endpoint, imageSrc, params = {}) {
+  let response;
+  try {
+    response = await postWithHandle(endpoint, imageSrc, params);
+    if (response.status === 404) {
+      // The handle expired or was evicted: upload again and retry once
+      imageHandles.delete(imageSrc);
+      response = await postWithHandle(endpoint, imageSrc, params);
+    }
+  } catch (error) {
+    return { success: false, error: error.message };
+  }
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}));
+    return { success: false, error: error.error || `Request failed with status ${response.status}` };
+  }
+
+  const metadata = JSON.parse(response.headers.get(METADATA_HEADER) || '{}');
+  const imageBlob = await response.blob();
+
+  return {
+    ...metadata,
+    image: URL.createObjectURL(imageBlob),
+    imageSize: imageBlob.size
+  };
+}